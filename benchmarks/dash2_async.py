@@ -0,0 +1,108 @@
+"""Compare the sync and async dash2 table callbacks.
+
+Run from the repository root with the usual DATABASE_* variables set:
+
+    python -m benchmarks.dash2_async --requests 400 --concurrency 32 --workers 4
+
+The sync path gets a pool of ``--workers`` threads, standing in for sync
+server workers; the async path serves every request from a single event loop.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from flask_app.dash_apps.dash2 import app2
+from flask_app.database import remove_sessions
+
+FILTERS = [
+    "",
+    "{country} contains 'an'",
+    "{population} > 10000000",
+    "{life_exp} < 60 && {gdp_percap} > 1000",
+]
+SORTS = [[], [{"column_id": "life_exp", "direction": "desc"}]]
+
+
+def make_requests(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(20), 25, rng.choice(SORTS), rng.choice(FILTERS), None)
+        for _ in range(count)
+    ]
+
+
+def sync_call(args):
+    start = time.perf_counter()
+    try:
+        app2.update_table(*args)
+    finally:
+        remove_sessions()
+    return time.perf_counter() - start
+
+
+async def async_call(args, limit):
+    async with limit:
+        start = time.perf_counter()
+        await app2.update_table_async(*args)
+        return time.perf_counter() - start
+
+
+def run_sync(requests, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(sync_call, requests))
+
+
+async def run_async(requests, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(async_call(args, limit) for args in requests))
+
+
+def report(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:>5}: {len(latencies) / elapsed:8.1f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.1f} ms"
+        f"  p95 {p95 * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    server = Flask(__name__)
+    server.config.update(
+        DASH2_ASYNC=True,
+        DASH2_ASYNC_POOL_SIZE=args.concurrency,
+        DASH2_PREFETCH_PAGES=0,
+        DASH2_COUNT_CACHE_SIZE=0,
+    )
+    app2.init_app("/dash2/", server)
+    app2.start()
+
+    requests = make_requests(args.requests)
+    # warm up connections and statement caches on both paths
+    run_sync(requests[: args.workers], args.workers)
+    asyncio.run(run_async(requests[: args.concurrency], args.concurrency))
+
+    start = time.perf_counter()
+    latencies = run_sync(requests, args.workers)
+    report("sync", latencies, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run_async(requests, args.concurrency))
+    report("async", latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
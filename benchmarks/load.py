@@ -0,0 +1,410 @@
+"""Load-test the three dashboards through their callback endpoint.
+
+Run from the repository root:
+
+    python -m benchmarks.load --scale 4 --concurrency 16 --seconds 30
+
+Requests are replayed as the browser would send them to
+``_dash-update-component``: checklist and slider changes on dash1, paging,
+sorting and filtering on dash2 and cell selection on dash3, mixed and issued
+concurrently against the WSGI app in this process.
+
+The data is synthetic (see benchmarks/synthetic.py) and loaded into a throwaway
+Postgres started with pgserver, whatever DATABASE_* says. ``--use-database``
+runs against the DATABASE_* database instead, seeding it and replacing its
+gapminder rows, so only pass it for a scratch database. Every run is saved to
+benchmarks/results/; ``--compare last`` or ``--compare FILE`` prints the change
+against an earlier run and exits with status 1 when a scenario regressed by more
+than ``--threshold``.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import synthetic
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+FILTERS = [
+    "",
+    "{country} contains 'an'",
+    "{country} contains 'ria'",
+    "{population} > 10000000",
+    "{life_exp} < 60 && {gdp_percap} > 1000",
+    "{gdp_percap} >= 5000",
+]
+SORTS = [
+    [],
+    [{"column_id": "life_exp", "direction": "desc"}],
+    [{"column_id": "population", "direction": "asc"}],
+    [{"column_id": "country", "direction": "asc"}],
+]
+TIPS_COLUMNS = ["total_bill", "tip", "sex", "smoker", "day", "time", "size"]
+
+
+def payload(outputs, inputs, state=(), changed=()):
+    # the body dash-renderer posts for a callback
+    def prop(item):
+        component, name = item[0].rsplit(".", 1)
+        return {"id": component, "property": name, "value": item[1]}
+
+    return {
+        "output": "..%s.." % "...".join(name for name in outputs),
+        "outputs": [prop((name, None)) for name in outputs],
+        "inputs": [prop(item) for item in inputs],
+        "state": [prop(item) for item in state],
+        "changedPropIds": list(changed),
+    }
+
+
+class Scenarios:
+    # builds the next request of each kind; `client` is the last output of
+    # each component for one simulated user, so dash2 pages forward from its
+    # cursor and dash1 sends its previous figure state
+
+    def __init__(self, rng, customers, cities, months, tip_ids):
+        self.rng = rng
+        self.customers = customers
+        self.cities = cities
+        self.months = months
+        self.tip_ids = tip_ids
+
+    def dash1_filters(self, client):
+        rng = self.rng
+        start = rng.randrange(self.months)
+        body = payload(
+            ["category-bar.figure", "product-bar.figure", "bar-figure-state.data"],
+            [
+                ("customer-checklist.value", self._subset(self.customers)),
+                ("city-checklist.value", self._subset(self.cities)),
+                ("date-range-slider.value", [start, rng.randint(start, self.months)]),
+            ],
+            [("bar-figure-state.data", client.get("bar-figure-state"))],
+            [rng.choice(["customer-checklist.value", "date-range-slider.value"])],
+        )
+        return "/dash1/_dash-update-component", body
+
+    def dash2_table(self, client):
+        rng = self.rng
+        cursor = client.get("table-cursor")
+        if cursor is not None and rng.random() < 0.6:
+            # next page with the same filter and sort
+            filter, sort_by, page_size = cursor["key"]
+            page, changed = cursor["page"] + 1, "table-sorting-filtering.page_current"
+        else:
+            filter, sort_by, page_size = rng.choice(FILTERS), rng.choice(SORTS), 10
+            page, changed = rng.randrange(20), "table-sorting-filtering.filter_query"
+        body = payload(
+            [
+                "table-page.data",
+                "table-sorting-filtering.page_count",
+                "table-cursor.data",
+            ],
+            [
+                ("table-sorting-filtering.page_current", page),
+                ("table-sorting-filtering.page_size", page_size),
+                ("table-sorting-filtering.sort_by", sort_by),
+                ("table-sorting-filtering.filter_query", filter),
+            ],
+            [("table-cursor.data", cursor)],
+            [changed],
+        )
+        return "/dash2/_dash-update-component", body
+
+    def dash3_cell(self, client):
+        rng = self.rng
+        row = rng.randrange(len(self.tip_ids))
+        column = rng.choice(TIPS_COLUMNS)
+        cell = {
+            "row": row,
+            "column": TIPS_COLUMNS.index(column),
+            "row_id": self.tip_ids[row],
+            "column_id": column,
+        }
+        body = payload(
+            [
+                "total-bill-bar.figure",
+                "table-triggered-message.children",
+                "total-bill-figure-state.data",
+            ],
+            [
+                ("tips-version.data", None),
+                ("tips-table.selected_columns", []),
+                ("tips-table.active_cell", cell),
+            ],
+            [("total-bill-figure-state.data", None)],
+            ["tips-table.active_cell"],
+        )
+        return "/dash3/_dash-update-component", body
+
+    def _subset(self, values):
+        return self.rng.sample(values, self.rng.randint(1, len(values)))
+
+
+def prepare(args, workdir):
+    if args.use_database:
+        standin = None
+    else:
+        standin = synthetic.LocalPostgres()
+        os.environ.update(standin.environ())
+        os.environ.pop("DATABASE_READ_HOST", None)
+
+    sales_path = os.path.join(workdir, "sales.xlsx")
+    synthetic.sales_frame(args.scale, args.seed).to_excel(sales_path, index=False)
+
+    # the engine is created on import, so only now that DATABASE_* is set
+    from sqlalchemy import delete, insert
+
+    from flask_app import app
+    from flask_app.database import engine
+    from flask_app.models import Gapminder
+
+    app.config.update(
+        DEBUG=False,
+        DASH1_DATA_PATH=sales_path,
+        DASH1_RELOAD_INTERVAL=0,
+        SHARED_DATA_DIR=os.path.join(workdir, "shared"),
+    )
+    result = app.test_cli_runner().invoke(args=["seed"])
+    if result.exit_code != 0:
+        raise RuntimeError(f"Seeding failed: {result.output}") from result.exception
+    with engine.begin() as conn:
+        conn.execute(delete(Gapminder))
+        conn.execute(
+            insert(Gapminder), synthetic.gapminder_records(args.scale, args.seed)
+        )
+        conn.exec_driver_sql("analyze gapminder")
+    return app, standin
+
+
+def login(app):
+    client = app.test_client()
+    client.post("/mlogin", data={"username": "editor", "password": "password"})
+    return client
+
+
+def scenarios_for(app, seed):
+    # mounts the dashboards, then reads the choices a user would see
+    login(app).get("/dash1/")
+    from flask_app.dash_apps.dash1 import app1
+    from flask_app.dash_apps.dash3 import app3
+
+    data = app1.dataset
+    return Scenarios(
+        random.Random(seed),
+        customers=[str(value) for value in data.customers],
+        cities=[str(value) for value in data.cities],
+        months=data.month_nums[-1],
+        tip_ids=[int(value) for value in app3.store.snapshot().frame["id"]],
+    )
+
+
+def run(app, scenarios, names, weights, concurrency, seconds, requests):
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    issued = iter(range(requests)) if requests else None
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        client = login(app)
+        state = {}
+        while True:
+            if issued is not None:
+                with lock:
+                    if next(issued, None) is None:
+                        return
+            elif time.perf_counter() >= deadline:
+                return
+            with lock:
+                name = scenarios.rng.choices(names, weights)[0]
+                path, body = getattr(scenarios, name)(state)
+            start = time.perf_counter()
+            response = client.post(path, json=body)
+            latency = time.perf_counter() - start
+            with lock:
+                if response.status_code in (200, 204):
+                    samples[name].append(latency)
+                else:
+                    errors[name] += 1
+            if response.status_code == 200:
+                for component, props in response.get_json()["response"].items():
+                    state.update((component, value) for value in props.values())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    results = {name: summarize(samples[name], errors[name], elapsed) for name in names}
+    every = [latency for name in names for latency in samples[name]]
+    results["total"] = summarize(every, sum(errors.values()), elapsed)
+    return results
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {"requests": 0, "errors": errors, "throughput": 0.0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+
+
+def report(results):
+    for name, stats in results.items():
+        if not stats["requests"]:
+            print(f"{name:>14}: no successful requests, {stats['errors']} errors")
+            continue
+        print(
+            f"{name:>14}: {stats['throughput']:8.1f} req/s"
+            f"  p50 {stats['p50_ms']:7.1f} ms"
+            f"  p95 {stats['p95_ms']:7.1f} ms"
+            f"  p99 {stats['p99_ms']:7.1f} ms"
+            f"  errors {stats['errors']}"
+        )
+
+
+def save(run_info, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{run_info['started'].replace(':', '')}.json")
+    with open(path, "w") as f:
+        json.dump(run_info, f, indent=2)
+    return path
+
+
+def previous_run(compare, directory, current):
+    if compare != "last":
+        return compare
+    runs = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(".json")
+    )
+    runs = [path for path in runs if os.path.abspath(path) != os.path.abspath(current)]
+    return runs[-1] if runs else None
+
+
+def compare_runs(previous, current, threshold):
+    # slower p95 or lower throughput by more than `threshold` counts as a regression
+    regressions = []
+    for name, stats in current["results"].items():
+        before = previous["results"].get(name)
+        if not before or not before["requests"] or not stats["requests"]:
+            continue
+        p95 = stats["p95_ms"] / before["p95_ms"] - 1
+        throughput = stats["throughput"] / before["throughput"] - 1
+        regressed = p95 > threshold or throughput < -threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:>14}: p95 {p95:+7.1%}  throughput {throughput:+7.1%}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--requests", type=int, help="stop after this many instead")
+    parser.add_argument(
+        "--mix",
+        default="dash1_filters=1,dash2_table=2,dash3_cell=1",
+        help="scenario weights",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=RESULTS_DIR)
+    parser.add_argument("--compare", help='an earlier results file, or "last"')
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument(
+        "--use-database",
+        action="store_true",
+        help="replace the data of the DATABASE_* database instead of pgserver's",
+    )
+    args = parser.parse_args()
+    if args.use_database and not os.environ.get("DATABASE"):
+        parser.error("--use-database needs DATABASE_* in the environment")
+
+    logging.basicConfig(level=logging.ERROR)
+    mix = dict(item.split("=") for item in args.mix.split(","))
+    names, weights = list(mix), [float(weight) for weight in mix.values()]
+
+    with tempfile.TemporaryDirectory(prefix="flask-dash-bench-") as workdir:
+        app, standin = prepare(args, workdir)
+        try:
+            scenarios = scenarios_for(app, args.seed)
+            # warm up connections, caches and lazily built state
+            run(app, scenarios, names, weights, args.concurrency, 0, 4 * len(names))
+            started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            results = run(
+                app,
+                scenarios,
+                names,
+                weights,
+                args.concurrency,
+                args.seconds,
+                args.requests,
+            )
+        finally:
+            if standin is not None:
+                standin.stop()
+
+    report(results)
+    run_info = {
+        "started": started,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "results": results,
+    }
+    path = save(run_info, args.results)
+    print(f"saved {path}")
+
+    if args.compare:
+        previous = previous_run(args.compare, args.results, path)
+        if previous is None:
+            print("nothing to compare with")
+            return
+        with open(previous) as f:
+            regressions = compare_runs(json.load(f), run_info, args.threshold)
+        print(f"compared with {previous}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
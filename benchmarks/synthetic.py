@@ -0,0 +1,120 @@
+"""Synthetic sales and gapminder data, and a throwaway Postgres to load it into.
+
+Scale 1 is about the size of data/dashboard.xlsx and the gapminder table; the
+row counts grow linearly with ``scale``, the vocabularies stay the same.
+"""
+
+import math
+import os
+import random
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+SALES_ROWS = 3500
+GAPMINDER_ROWS = 34000
+
+CUSTOMERS = ["Лента", "Ашан", "О'КЕЙ", "Магнит", "Перекресток", "Дикси"]
+CITIES = [
+    "Москва",
+    "Санкт-Петербург",
+    "Екатеринбург",
+    "Новосибирск",
+    "Ростов-на-Дону",
+    "Волгоград",
+]
+PRODUCTS = {
+    "Овощи": ["Картофель", "Морковь", "Лук", "Капуста", "Огурцы", "Томаты"],
+    "Фрукты": ["Яблоки", "Груши", "Бананы", "Апельсины", "Мандарины", "Лимоны"],
+    "Зелень": ["Укроп", "Петрушка", "Кинза", "Базилик", "Салат", "Шпинат"],
+    "Ягоды": ["Клубника", "Малина", "Черника", "Смородина", "Крыжовник", "Вишня"],
+}
+SYLLABLES = ["an", "bel", "cor", "da", "en", "fra", "gu", "ia", "ja", "ka", "land"]
+SYLLABLES += ["mo", "nia", "or", "po", "ria", "sta", "tan", "u", "via", "zan"]
+
+
+def sales_frame(scale=1, seed=0, months=12):
+    rng = np.random.default_rng(seed)
+    rows = int(SALES_ROWS * scale)
+    products = [(c, p) for c, names in PRODUCTS.items() for p in names]
+    prices = rng.integers(20, 300, len(products)) * 5
+
+    days = pd.date_range("2024-01-01", periods=months * 30, freq="D")
+    product = rng.integers(0, len(products), rows)
+    quantity = rng.integers(1, 100, rows)
+    return pd.DataFrame(
+        {
+            # sorted, like the workbook, so that appended rows stay appends
+            "Дата": np.sort(rng.choice(days.values, rows)),
+            "Заказчик": rng.choice(CUSTOMERS, rows).astype(object),
+            "Город": rng.choice(CITIES, rows).astype(object),
+            "Категория товара": np.array([c for c, _ in products], dtype=object)[
+                product
+            ],
+            "Товар": np.array([p for _, p in products], dtype=object)[product],
+            "Цена за упаковку": prices[product],
+            "Количество": quantity,
+            "Итого": prices[product] * quantity,
+        }
+    )
+
+
+def gapminder_records(scale=1, seed=0):
+    rng = random.Random(seed)
+    countries = sorted(
+        {
+            "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).capitalize()
+            for _ in range(400)
+        }
+    )
+    records = []
+    for i in range(int(GAPMINDER_ROWS * scale)):
+        gdp = rng.lognormvariate(8, 1.2)
+        records.append(
+            {
+                "id": i + 1,
+                "country": rng.choice(countries),
+                "population": int(rng.lognormvariate(15.5, 1.8)),
+                "life_exp": round(min(85.0, 35 + 4.5 * math.log1p(gdp / 300)), 1),
+                "gdp_percap": round(gdp, 2),
+            }
+        )
+    return records
+
+
+class LocalPostgres:
+    # A Postgres cluster in a temporary directory for machines without a
+    # database; removed again by stop(). Needs `pip install pgserver`.
+
+    def __init__(self, directory=None):
+        if pgserver is None:
+            raise RuntimeError(
+                "pgserver is not installed: pip install pgserver, or set"
+                " DATABASE_USER, DATABASE_PASS and DATABASE to a scratch database"
+            )
+        self.directory = directory or tempfile.mkdtemp(prefix="flask-dash-bench-")
+        self.server = pgserver.get_server(
+            self.directory, cleanup_mode="delete" if directory is None else "stop"
+        )
+
+    def environ(self, database="bench"):
+        exists = self.server.psql(
+            f"select 1 from pg_database where datname = '{database}'"
+        )
+        if "(1 row)" not in exists:
+            self.server.psql(f"create database {database}")
+        # database_url() puts DATABASE last, so the socket rides along as a query
+        return {
+            "DATABASE_USER": "postgres",
+            "DATABASE_PASS": "",
+            "DATABASE": f"{database}?host={os.path.abspath(self.directory)}",
+        }
+
+    def stop(self):
+        self.server.cleanup()
@@ -1,17 +1,17 @@
 import os
 from datetime import timedelta
 
-from flask import Flask, g
+from flask import Flask
 from flask_security.core import Security
-from flask_security.datastore import SQLAlchemySessionUserDatastore
-from flask_security.utils import hash_password
-from werkzeug.middleware.dispatcher import DispatcherMiddleware
-
-from .dash_apps.dash1 import app1
-from .dash_apps.dash2 import app2
-from .dash_apps.dash3 import app3
-from .database import db_session, init_db
+
+from . import profiling
+from .assets import StaticAssets
+from .compression import Compression
+from .dashboards import DashboardRegistry
+from .database import db_session, remove_sessions
 from .models import Role, User
+from .startup import stage
+from .users import CachedUserDatastore
 
 app = Flask(__name__)
 app.config["DEBUG"] = True
@@ -26,9 +26,16 @@ app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=30)
 app.config["SECURITY_LOGIN_USER_TEMPLATE"] = "login.html"
 
 # manage sessions per request - make sure connections are closed and returned
-app.teardown_appcontext(lambda exc: db_session.close())
+app.teardown_appcontext(lambda exc: remove_sessions())
+
 
-user_datastore = SQLAlchemySessionUserDatastore(db_session, User, Role)
+user_datastore = CachedUserDatastore(
+    db_session,
+    User,
+    Role,
+    maxsize=app.config.get("USER_CACHE_SIZE", 1024),
+    ttl=app.config.get("USER_CACHE_TTL", 60),
+)
 security = Security(app, user_datastore)
 
 from .auth import auth
@@ -39,38 +46,51 @@ from .main import main
 
 app.register_blueprint(main)
 
-with app.app_context():
-    init_db()
-    security.datastore.find_or_create_role(
-        name="editor", permissions={"user-read", "user-write"}
+profiling.init_app(app)
+
+from .commands import import_sales, seed, startup_report
+
+app.cli.add_command(seed)
+app.cli.add_command(startup_report)
+app.cli.add_command(import_sales)
+
+dashboards = DashboardRegistry(app)
+dashboards.register("dash1", "/dash1/", "flask_app.dash_apps.dash1.app1")
+dashboards.register("dash2", "/dash2/", "flask_app.dash_apps.dash2.app2")
+dashboards.register("dash3", "/dash3/", "flask_app.dash_apps.dash3.app3")
+app.wsgi_app = dashboards.wsgi(app.wsgi_app)
+
+# the dashboards are mounted on app itself; kept for servers configured
+# with flask_app:dash_app
+dash_app = app
+
+if app.config.get("COMPRESSION", True):
+    app.wsgi_app = Compression(
+        app.wsgi_app,
+        min_size=app.config.get("COMPRESSION_MIN_SIZE", 1024),
+        level=app.config.get("COMPRESSION_LEVEL", 6),
+        brotli_quality=app.config.get("COMPRESSION_BROTLI_QUALITY", 4),
+        zstd_level=app.config.get("COMPRESSION_ZSTD_LEVEL", 3),
+        stream_threshold=app.config.get("COMPRESSION_STREAM_THRESHOLD", 1 << 20),
     )
-    security.datastore.find_or_create_role(name="reader", permissions={"user-read"})
-    db_session.commit()
-    if not security.datastore.find_user(username="editor"):
-        security.datastore.create_user(
-            email="editor",
-            username="editor",
-            password=hash_password("password"),
-            roles=["editor"],
-        )
-    if not security.datastore.find_user(username="reader"):
-        security.datastore.create_user(
-            email="reader",
-            username="reader",
-            password=hash_password("password"),
-            roles=["reader"],
-        )
-    db_session.commit()
-
-    g.session = db_session
-    dash_app = DispatcherMiddleware(
-        app,
-        {
-            "/dash1": app1.init_app("/dash1/", app),
-            "/dash2": app2.init_app("/dash2/", app),
-            "/dash3": app3.init_app("/dash3/", app),
-        },
+
+# outermost, its bundles are already compressed
+if app.config.get("DASH_STATIC_FAST_PATH", True):
+    app.wsgi_app = StaticAssets(
+        app.wsgi_app,
+        ["/dash1/", "/dash2/", "/dash3/"],
+        cache_dir=app.config.get("DASH_ASSET_CACHE_DIR", "data/.cache/assets"),
     )
 
+
+def preload():
+    # for servers that fork workers from one parent, see gunicorn.conf.py;
+    # the workers then share the loaded data copy-on-write
+    dashboards.mount_all(start=False)
+    if isinstance(app.wsgi_app, StaticAssets):
+        with stage("preload assets"):
+            app.wsgi_app.preload()
+
+
 if __name__ == "__main__":
     app.run(debug=True)
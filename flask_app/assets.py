@@ -0,0 +1,183 @@
+import gzip
+import importlib
+import logging
+import mimetypes
+import os
+import pkgutil
+import re
+import sys
+import threading
+
+from .compression import negotiate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DIST_ATTRIBUTES = ("_js_dist_dependencies", "_js_dist", "_css_dist")
+DASH_MODULES = ("dash._dash_renderer", "dash.dcc", "dash.html", "dash.dash_table")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class StaticAssets:
+    # Serves fingerprinted Dash component bundles ahead of the Flask app: no
+    # login check, no session, no routing. Each bundle and its gzip/brotli
+    # variants are read into memory on first use, or all at once by preload();
+    # compressed variants are kept on disk between restarts. Anything else
+    # falls through to the app.
+
+    def __init__(self, wsgi_app, prefixes, cache_dir, gzip_level=9, brotli_quality=11):
+        self.wsgi_app = wsgi_app
+        self.pattern = re.compile(
+            "^(?:%s)_dash-component-suites/([^/]+)/(.+)$"
+            % "|".join(re.escape(prefix) for prefix in prefixes)
+        )
+        self.cache_dir = cache_dir
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.assets = {}
+        self.known = set()
+        self._lock = threading.Lock()
+
+    def preload(self):
+        for namespace, path in sorted(dist_paths()):
+            self._asset(namespace, path)
+
+    def __call__(self, environ, start_response):
+        match = self.pattern.match(environ.get("PATH_INFO", ""))
+        if match is None or environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return self.wsgi_app(environ, start_response)
+        path, fingerprinted = check_fingerprint(match.group(2))
+        asset = self._asset(match.group(1), path) if fingerprinted else None
+        if asset is None:
+            return self.wsgi_app(environ, start_response)
+
+        mimetype, variants = asset
+        encoding = negotiate(
+            environ.get("HTTP_ACCEPT_ENCODING", ""),
+            [encoding for encoding in ("br", "gzip") if encoding in variants],
+        )
+        body = variants[encoding]
+        headers = [
+            ("Content-Type", mimetype),
+            ("Content-Length", str(len(body))),
+            ("Cache-Control", IMMUTABLE),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        return [b""] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+    def _asset(self, namespace, path):
+        key = namespace, path
+        if key in self.assets:
+            return self.assets[key]
+        with self._lock:
+            if key not in self.known:
+                # packages are registered as the dashboards get imported
+                self.known = dist_paths()
+                if key not in self.known:
+                    return None
+            if key not in self.assets:
+                try:
+                    self.assets[key] = self._load(namespace, path)
+                except FileNotFoundError:
+                    # some packages declare source maps they do not ship
+                    logger.debug("No file for %s/%s", namespace, path)
+                    self.assets[key] = None
+            return self.assets[key]
+
+    def _load(self, namespace, path):
+        data = pkgutil.get_data(namespace, path)
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if mimetype.startswith("text/") or mimetype.endswith("javascript"):
+            mimetype += "; charset=utf-8"
+
+        variants = {"identity": data}
+        source = os.path.join(os.path.dirname(sys.modules[namespace].__file__), path)
+        # mtime and version in the name, so upgraded packages never hit stale files
+        stem = os.path.join(
+            self.cache_dir,
+            namespace,
+            f"{_version(namespace)}-{os.stat(source).st_mtime_ns}",
+            path,
+        )
+        compressors = {"gzip": (".gz", self._gzip)}
+        if brotli is not None:
+            compressors["br"] = (".br", self._brotli)
+        for encoding, (suffix, compress) in compressors.items():
+            variant = _read(stem + suffix)
+            if variant is None:
+                variant = compress(data)
+                _write(stem + suffix, variant)
+            # small or already compressed files are served as they are
+            if len(variant) < len(data):
+                variants[encoding] = variant
+        return mimetype, variants
+
+    def _gzip(self, data):
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _brotli(self, data):
+        return brotli.compress(data, quality=self.brotli_quality)
+
+
+def check_fingerprint(path):
+    from dash.fingerprint import check_fingerprint
+
+    return check_fingerprint(path)
+
+
+def dist_paths():
+    # the same resource declarations Dash builds its script and link tags from
+    from dash.development.base_component import ComponentRegistry
+
+    modules = [sys.modules[name] for name in ComponentRegistry.registry]
+    modules += [importlib.import_module(name) for name in DASH_MODULES]
+    paths = set()
+    for module in modules:
+        for attribute in DIST_ATTRIBUTES:
+            for resource in getattr(module, attribute, []):
+                for key in ("relative_package_path", "dev_package_path"):
+                    for path in _flatten(resource.get(key)):
+                        paths.add((resource["namespace"], path))
+    return paths
+
+
+def _flatten(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [path for paths in value.values() for path in _flatten(paths)]
+    return [path for paths in value for path in _flatten(paths)]
+
+
+def _version(namespace):
+    return getattr(sys.modules[namespace], "__version__", "0")
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Could not write asset cache %s", path, exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_missing = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is not _missing:
+                value, expires = item
+                if expires is None or expires > self.timer():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else self.timer() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _missing)
+            return default if item is _missing else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution: the first
+    # caller runs the function, the others wait for its result or error.
+    # Nothing is kept once the call is done, caching is left to the caller.
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(function(*args))
+            except BaseException as error:
+                future.set_exception(error)
+            finally:
+                self._leave(key)
+        return future.result()
+
+    async def do_async(self, key, function, *args):
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(await function(*args))
+            except BaseException as error:
+                future.set_exception(error)
+            finally:
+                self._leave(key)
+        # the leader may run on another thread's event loop
+        return await asyncio.wrap_future(future)
+
+    def _join(self, key):
+        with self._lock:
+            self.calls += 1
+            future = self._futures.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._futures[key] = Future()
+            return future, True
+
+    def _leave(self, key):
+        with self._lock:
+            del self._futures[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "shared": self.shared,
+                "in_flight": len(self._futures),
+            }
+
+
+def canonical_key(*args):
+    # equal callback inputs give equal keys, whatever their dict ordering
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
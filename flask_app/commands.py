@@ -0,0 +1,80 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_security.utils import hash_password
+
+from . import startup
+from .database import db_session, engine, init_db
+
+
+@click.command("seed")
+@with_appcontext
+def seed():
+    """Create the tables, roles, default users and the tips data."""
+    security = current_app.extensions["security"]
+
+    with startup.stage("create tables"):
+        init_db()
+
+    with startup.stage("roles and users"):
+        security.datastore.find_or_create_role(
+            name="editor", permissions={"user-read", "user-write"}
+        )
+        security.datastore.find_or_create_role(name="reader", permissions={"user-read"})
+        db_session.commit()
+        if not security.datastore.find_user(username="editor"):
+            security.datastore.create_user(
+                email="editor",
+                username="editor",
+                password=hash_password("password"),
+                roles=["editor"],
+            )
+        if not security.datastore.find_user(username="reader"):
+            security.datastore.create_user(
+                email="reader",
+                username="reader",
+                password=hash_password("password"),
+                roles=["reader"],
+            )
+        db_session.commit()
+
+    with startup.stage("tips"):
+        import plotly.express as px
+
+        from .dash_apps.dash3.store import seed_tips
+
+        with engine.begin() as conn:
+            seed_tips(conn, px.data.tips())
+
+    click.echo(startup.report())
+
+
+@click.command("startup-report")
+@with_appcontext
+def startup_report():
+    """Mount every dashboard and show how long each startup stage took."""
+    from . import preload
+
+    preload()
+    click.echo(startup.report())
+
+
+@click.command("import-sales")
+@click.argument("path", required=False)
+@with_appcontext
+def import_sales(path):
+    """Load the dash1 sales workbook into Postgres and refresh its rollups."""
+    from .dash_apps.dash1.data import load_sales
+    from .dash_apps.dash1.rollup import replace_sales
+
+    path = path or current_app.config.get("DASH1_DATA_PATH", "data/dashboard.xlsx")
+    with startup.stage("create tables"):
+        init_db()
+    with startup.stage("read workbook"):
+        frame = load_sales(path)
+    with startup.stage("import sales"):
+        with engine.begin() as conn:
+            rows = replace_sales(conn, frame)
+
+    click.echo(f"Imported {rows} sales from {path}")
+    click.echo(startup.report())
@@ -0,0 +1,226 @@
+import time
+import zlib
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+
+class Compression:
+    # Compresses responses for clients that accept it. Bodies with a known
+    # length up to stream_threshold are compressed in one go and keep their
+    # Content-Length; larger or unsized bodies are compressed chunk by chunk.
+
+    def __init__(
+        self,
+        wsgi_app,
+        min_size=1024,
+        level=6,
+        brotli_quality=4,
+        zstd_level=3,
+        stream_threshold=1 << 20,
+    ):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.stream_threshold = stream_threshold
+        self.encoders = {}
+        if brotli is not None:
+            self.encoders["br"] = lambda: BrotliEncoder(brotli_quality)
+        if zstandard is not None:
+            self.encoders["zstd"] = lambda: ZstdEncoder(zstd_level)
+        self.encoders["gzip"] = lambda: GzipEncoder(level)
+
+        self.responses = metrics.counter(
+            "compression_responses", "responses compressed"
+        )
+        self.bytes_in = metrics.counter(
+            "compression_bytes_in", "response bytes before compression"
+        )
+        self.bytes_out = metrics.counter(
+            "compression_bytes_out", "response bytes after compression"
+        )
+        self.cpu_seconds = metrics.counter(
+            "compression_cpu_seconds", "thread cpu time spent compressing"
+        )
+        metrics.gauge(
+            "compression_bytes_saved",
+            "bytes not sent thanks to compression",
+            lambda: self.bytes_in.value - self.bytes_out.value,
+        )
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""), self.encoders)
+        if encoding == "identity" or environ["REQUEST_METHOD"] == "HEAD":
+            return self.wsgi_app(environ, start_response)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            # the legacy write() callable is not supported
+            return None
+
+        app_iter = self.wsgi_app(environ, capture)
+        return self._respond(app_iter, captured, encoding, start_response)
+
+    def _respond(self, app_iter, captured, encoding, start_response):
+        try:
+            chunks = iter(app_iter)
+            if not captured:
+                # the app delays start_response until its first chunk
+                first = next(chunks, b"")
+                chunks = _prepend(first, chunks)
+            status, headers, exc_info = captured
+            length = _header(headers, "Content-Length")
+            if not compressible(status, headers) or (
+                length is not None and int(length) < self.min_size
+            ):
+                start_response(status, headers, exc_info)
+                yield from chunks
+                return
+
+            encoder = self.encoders[encoding]()
+            if length is not None and int(length) <= self.stream_threshold:
+                body = b"".join(chunks)
+                compressed = self._compress(encoder, [body])
+                start_response(
+                    status, _headers(headers, encoding, len(compressed)), exc_info
+                )
+                yield compressed
+                return
+
+            start_response(status, _headers(headers, encoding, None), exc_info)
+            for chunk in chunks:
+                compressed = self._compress(encoder, [chunk], finish=False)
+                if compressed:
+                    yield compressed
+            yield self._compress(encoder, [], finish=True)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    def _compress(self, encoder, chunks, finish=True):
+        start = time.thread_time()
+        compressed = b"".join(encoder.compress(chunk) for chunk in chunks)
+        if finish:
+            compressed += encoder.finish()
+            self.responses.inc()
+        self.cpu_seconds.inc(time.thread_time() - start)
+        self.bytes_in.inc(sum(len(chunk) for chunk in chunks))
+        self.bytes_out.inc(len(compressed))
+        return compressed
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def negotiate(accept_encoding, encodings):
+    # the first of `encodings` the client accepts, in our order of preference
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def compressible(status, headers):
+    if status[:3] in ("204", "206", "304"):
+        return False
+    if _header(headers, "Content-Encoding") is not None:
+        return False
+    if "no-transform" in (_header(headers, "Cache-Control") or ""):
+        return False
+    content_type = (_header(headers, "Content-Type") or "").split(";")[0]
+    return content_type.strip().lower() in COMPRESSIBLE_TYPES
+
+
+def _headers(headers, encoding, length):
+    vary = _header(headers, "Vary")
+    result = [
+        (name, value)
+        for name, value in headers
+        if name.lower() not in ("content-length", "vary")
+    ]
+    result.append(("Content-Encoding", encoding))
+    result.append(("Vary", f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"))
+    if length is not None:
+        result.append(("Content-Length", str(length)))
+    # the encoded body is a different representation, a strong ETag would lie
+    return [
+        (
+            (name, "W/" + value)
+            if name.lower() == "etag" and not value.startswith("W/")
+            else (name, value)
+        )
+        for name, value in result
+    ]
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+OTHER = "Other"
+
+
+def aggregate(frame, by, value, how="sum"):
+    # one mark per group instead of one per record; groups keep the order in
+    # which they first appear so plotly assigns colors and categories as before
+    return frame.groupby(by, sort=False, observed=True)[value].agg(how).reset_index()
+
+
+def top_n(values, n, other=OTHER):
+    # at most n entries: the n - 1 largest in their original order and the
+    # remainder summed into `other`
+    if n is None or len(values) <= n:
+        return values
+    kept = values[values.index.isin(values.nlargest(n - 1).index)]
+    rest = values.drop(kept.index).sum()
+    return pd.concat([kept, pd.Series([rest], index=[other], name=values.name)])
+
+
+def downsample(series, max_points, how="mean"):
+    # merge runs of consecutive points into at most max_points bins, each
+    # labelled by its first index value
+    if max_points is None or len(series) <= max_points:
+        return series
+    size = -(-len(series) // max_points)
+    binned = series.groupby(np.arange(len(series)) // size).agg(how)
+    binned.index = series.index[::size]
+    return binned.rename(series.name)
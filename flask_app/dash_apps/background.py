@@ -0,0 +1,122 @@
+import threading
+import time
+
+from dash import DiskcacheManager
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+# the job entry of a call whose process is being started
+STARTING = -1
+STARTING_EXPIRE = 10
+
+_lock = threading.RLock()
+
+
+class CoalescingDiskcacheManager(DiskcacheManager):
+    # Runs background callbacks in subprocesses with results in a disk cache
+    # shared by every worker on the host. Identical calls share one job: a
+    # call whose result is still cached gets it without starting a job, one
+    # whose job is running joins it. A job is only killed on cancel once
+    # every caller has let go of it. Results are always kept (until `expire`
+    # seconds after they were last read), so that every joined caller can
+    # still read them.
+    #
+    # SQLite lock state is per process and copied by fork, so within a worker
+    # the cache is only used under one lock, which is held across the fork.
+
+    def __init__(self, cache, cache_by=None, expire=None):
+        super().__init__(cache, cache_by=cache_by or [], expire=expire)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        while True:
+            with _lock:
+                job = self._join(key)
+                if job is None:
+                    return self._start(key, job_fn, args, context)
+                if job != STARTING:
+                    return job
+            # another worker is starting it
+            time.sleep(0.05)
+
+    def _join(self, key):
+        with self.handle.transact():
+            if self.result_ready(key):
+                # job 0 is never running and never terminated
+                return 0
+            job = self.handle.get(f"{key}-job")
+            if job is None or job != STARTING and not self.job_running(job):
+                # claimed for us, other callers wait for the pid
+                self.handle.set(f"{key}-job", STARTING, expire=STARTING_EXPIRE)
+                return None
+            if job != STARTING:
+                self.handle.incr(f"job-{job}-callers")
+            return job
+
+    def _start(self, key, job_fn, args, context):
+        # forked outside the transaction and without this thread's
+        # connection; the job opens its own to write the result
+        self.handle.close()
+        try:
+            job = super().call_job_fn(key, job_fn, args, context)
+        except BaseException:
+            self.handle.delete(f"{key}-job")
+            raise
+        with self.handle.transact():
+            self.handle.set(f"{key}-job", job, expire=self.expire)
+            self.handle.incr(f"job-{job}-callers")
+        return job
+
+    def terminate_job(self, job):
+        if not job:
+            return
+        job = int(job)
+        with _lock:
+            with self.handle.transact():
+                if self.handle.decr(f"job-{job}-callers", default=1) > 0:
+                    return
+                self.handle.delete(f"job-{job}-callers")
+            super().terminate_job(job)
+
+    def result_ready(self, key):
+        with _lock:
+            return super().result_ready(key)
+
+    def get_result(self, key, job):
+        with _lock:
+            return super().get_result(key, job)
+
+    def get_progress(self, key):
+        with _lock:
+            return super().get_progress(key)
+
+    def get_updated_props(self, key):
+        with _lock:
+            return super().get_updated_props(key)
+
+    def get_or_create_signing_secret(self, generate):
+        with _lock:
+            return super().get_or_create_signing_secret(generate)
+
+
+def background_options(server, prefix, cache_by=None, expire=None, ignore=None):
+    # app.callback() keyword arguments that run a callback on the background
+    # manager when <prefix>_BACKGROUND is set, and none otherwise
+    if not server.config.get(f"{prefix}_BACKGROUND", False):
+        return {}
+    if diskcache is None:
+        raise ImportError('Background callbacks need: pip install "dash[diskcache]"')
+    if "dash_background_cache" not in server.extensions:
+        server.extensions["dash_background_cache"] = diskcache.Cache(
+            server.config.get("DASH_BACKGROUND_CACHE_DIR", "data/.cache/background")
+        )
+    manager = CoalescingDiskcacheManager(
+        server.extensions["dash_background_cache"], cache_by=cache_by, expire=expire
+    )
+    return {
+        "background": True,
+        "manager": manager,
+        "cache_args_to_ignore": ignore or [],
+    }
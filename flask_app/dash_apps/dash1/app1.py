@@ -1,14 +1,32 @@
 import locale
+from collections import namedtuple
 
 import dash_bootstrap_components as dbc
+import numpy as np
 import pandas as pd
 import plotly.express as px
-from dash import Dash, Input, Output, dcc, html
+from dash import Dash, Input, Output, State, dcc, html
 
+from ... import metrics
+from ...cache import LRUCache, SingleFlight
+from ...database import read_engine
+from ...profiling import profiled, stage
+from ...shared import SharedFrames, decategorize
+from ..aggregate import downsample, top_n
+from ..background import background_options
+from ..figures import figure_state, patch_figure
+from . import rollup
+from .cube import SalesCube
+from .data import SalesWatcher, appended_rows, load_sales, source_signature
+from .rollup import RollupWatcher, SalesRollup
+
+Dataset = namedtuple(
+    "Dataset",
+    "generation df dates month_nums slicer_marks customers cities cube trend_figure",
+)
 
-def init_app(url_path, server=None):
-    global df
 
+def init_app(url_path, server=None):
     locale.setlocale(locale.LC_TIME, "ru_RU.UTF-8")
 
     global labelalias
@@ -27,31 +45,189 @@ def init_app(url_path, server=None):
         "Dec": "Дек",
     }
 
-    df = pd.read_excel("data/dashboard.xlsx")
-    df.set_index("Дата", inplace=True)
+    # external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
+    # app = Dash(__name__, external_stylesheets=external_stylesheets)
+    app = Dash(
+        __name__,
+        server=server,
+        external_stylesheets=[dbc.themes.BOOTSTRAP],
+        routes_pathname_prefix=url_path,
+    )
+
+    global figure_cache
+    figure_cache = LRUCache(
+        maxsize=app.server.config.get("DASH1_FIGURE_CACHE_SIZE", 256),
+        ttl=app.server.config.get("DASH1_FIGURE_CACHE_TTL", 600),
+    )
+    for stat, help in (
+        ("hits", "bar figures served from the cache"),
+        ("misses", "bar figures built because they were not cached"),
+        ("size", "bar figures in the cache"),
+    ):
+        metrics.gauge(
+            f"dash1_figure_cache_{stat}",
+            help,
+            lambda stat=stat: figure_cache.stats()[stat],
+        )
+    metrics.gauge(
+        "dash1_figure_cache_hit_rate",
+        "share of bar figure requests served from the cache",
+        lambda: figure_cache.hits / ((figure_cache.hits + figure_cache.misses) or 1),
+    )
+    global flights
+    flights = SingleFlight()
+    metrics.gauge(
+        "dash1_bars_shared",
+        "bar figures taken from an identical call in flight",
+        lambda: flights.shared,
+    )
+
+    global patch_figures, background
+    patch_figures = app.server.config.get("DASH_PATCH_FIGURES", True)
+    background = background_options(
+        app.server,
+        "DASH1",
+        cache_by=[lambda: dataset.generation],
+        expire=app.server.config.get("DASH1_FIGURE_CACHE_TTL", 600),
+        # previous_states, unused without patching
+        ignore=[3],
+    )
+    if background:
+        # one job serves every browser, so it cannot patch any one's figures
+        patch_figures = False
+
+    global max_categories, max_products, trend_max_points
+    max_categories = app.server.config.get("DASH1_MAX_CATEGORIES", 25)
+    max_products = app.server.config.get("DASH1_MAX_PRODUCTS", 25)
+    trend_max_points = app.server.config.get("DASH1_TREND_MAX_POINTS", 120)
+
+    global data_path, shared, sql_rollups
+    data_path = app.server.config.get("DASH1_DATA_PATH", "data/dashboard.xlsx")
+    shared = SharedFrames(app.server.config.get("SHARED_DATA_DIR"))
+    # with rollups the workbook is loaded by `flask import-sales` and Postgres
+    # aggregates the figures, so workers hold no sales rows
+    sql_rollups = app.server.config.get("DASH1_SQL_ROLLUPS", False)
+    global dataset
+    dataset = load_dataset()
+
+    global watcher
+    watcher = None
+    reload_interval = app.server.config.get("DASH1_RELOAD_INTERVAL", 5)
+    if reload_interval and sql_rollups:
+        watcher = RollupWatcher(reload_dataset, reload_interval)
+    elif reload_interval:
+        watcher = SalesWatcher(data_path, reload_dataset, reload_interval)
+
+    app.layout = serve_layout
+
+    init_callbacks(app)
+    return app.server
+
+
+def start():
+    if watcher is not None:
+        watcher.start()
+
+
+def publish_sales():
+    # the workbook is parsed by whichever worker gets there first, the others
+    # attach the same read-only columns
+    generation = shared.publish(
+        "sales",
+        lambda: load_sales(data_path).set_index("Дата"),
+        source=source_signature(data_path),
+    )
+    return shared.attach("sales", generation)
+
+
+def load_dataset(previous=None):
+    # the current dataset, or previous when its data has not changed
+    if sql_rollups:
+        with read_engine.connect() as conn:
+            generation = rollup.generation(conn)
+            if previous is not None and generation == previous.generation:
+                return previous
+            return build_rollup_dataset(conn, generation)
+    attached = publish_sales()
+    if previous is not None and attached.generation == previous.generation:
+        return previous
+    return build_dataset(attached, previous)
+
+
+def build_dataset(attached, previous=None):
+    df = attached.frame
 
     months = df.index.to_period("M").unique()
+    first_date = df.index.min() - pd.DateOffset(days=1)  # pyright: ignore [reportOperatorIssue]
+    dates, month_nums, slicer_marks = month_slider(months, first_date)
+
+    cube = None
+    if previous is not None:
+        rows = appended_rows(previous.df, df)
+        if rows is not None:
+            cube = previous.cube.append(decategorize(rows), dates)
+    if cube is None:
+        cube = SalesCube(decategorize(df), dates)
+
+    return Dataset(
+        generation=attached.generation,
+        df=df,
+        dates=dates,
+        month_nums=month_nums,
+        slicer_marks=slicer_marks,
+        customers=np.asarray(df["Заказчик"].unique(), dtype=object),
+        cities=np.asarray(df["Город"].unique(), dtype=object),
+        cube=cube,
+        trend_figure=create_trend_graph(df.resample("1ME")["Итого"].sum()),
+    )
+
+
+def build_rollup_dataset(conn, generation):
+    months, first_sale = rollup.months(conn)
+    if first_sale is None:
+        raise RuntimeError("No sales to show, load them with: flask import-sales")
+    first_date = first_sale - pd.DateOffset(days=1)
+    dates, month_nums, slicer_marks = month_slider(months, first_date)
+    customers, cities = rollup.segments(conn)
+
+    return Dataset(
+        generation=generation,
+        df=None,
+        dates=dates,
+        month_nums=month_nums,
+        slicer_marks=slicer_marks,
+        customers=customers,
+        cities=cities,
+        cube=SalesRollup(read_engine, dates),
+        trend_figure=create_trend_graph(rollup.trend(conn)),
+    )
+
+
+def month_slider(months, first_date):
+    # slider position 0 stands for the day before the first sale, position i
+    # for the last day of the i-th month
     month_nums = range(0, len(months) + 1)
     strings = months.strftime("%b-%Y")
-    global dates
     dates = months.strftime("%Y-%m-%d")
-    first_date = df.index.min() - pd.DateOffset(days=1)  # pyright: ignore [reportOperatorIssue]
     dates = dates.insert(0, first_date.strftime("%Y-%m-%d"))
     slicer_marks = dict(zip(month_nums, strings))
+    return dates, month_nums, slicer_marks
 
-    customers = df["Заказчик"].unique()
-    cities = df["Город"].unique()
 
-    # external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
-    # app = Dash(__name__, external_stylesheets=external_stylesheets)
-    app = Dash(
-        __name__,
-        server=server,
-        external_stylesheets=[dbc.themes.BOOTSTRAP],
-        routes_pathname_prefix=url_path,
-    )
+def reload_dataset():
+    # everything is derived before the swap; callbacks read the module global
+    # once, so they see either the old or the new dataset, never a mix
+    global dataset
+    loaded = load_dataset(dataset)
+    if loaded is dataset:
+        return
+    dataset = loaded
+    figure_cache.clear()
 
-    app.layout = [
+
+def serve_layout():
+    data = dataset
+    return [
         html.Nav(
             [
                 html.A("Logout", href="/logout"),
@@ -61,7 +237,7 @@ def init_app(url_path, server=None):
         ),
         html.H2("Отчет о продажах"),
         html.Hr(),
-        dcc.Graph(figure=create_trend_graph()),
+        dcc.Graph(figure=data.trend_figure),
         dbc.Row(
             [
                 dbc.Col(
@@ -69,9 +245,9 @@ def init_app(url_path, server=None):
                         dcc.Checklist(
                             [
                                 {"label": html.Span(i, className="button"), "value": i}
-                                for i in customers
+                                for i in data.customers
                             ],
-                            value=customers,
+                            value=data.customers,
                             labelClassName="custom-checkbox",
                             style={"margin": 30},
                             id="customer-checklist",
@@ -79,9 +255,9 @@ def init_app(url_path, server=None):
                         dcc.Checklist(
                             [
                                 {"label": html.Span(i, className="button"), "value": i}
-                                for i in cities
+                                for i in data.cities
                             ],
-                            value=cities,
+                            value=data.cities,
                             labelClassName="custom-checkbox",
                             style={"margin": 30},
                             id="city-checklist",
@@ -98,12 +274,13 @@ def init_app(url_path, server=None):
                             ],
                             style={"marginBottom": 40},
                         ),
+                        dcc.Store(id="bar-figure-state"),
                         dcc.RangeSlider(
-                            min=month_nums[0],
-                            max=month_nums[-1],
-                            value=[month_nums[0], month_nums[-1]],
+                            min=data.month_nums[0],
+                            max=data.month_nums[-1],
+                            value=[data.month_nums[0], data.month_nums[-1]],
                             step=1,
-                            marks=slicer_marks,
+                            marks=data.slicer_marks,
                             included=True,
                             updatemode="mouseup",
                             id="date-range-slider",
@@ -114,12 +291,11 @@ def init_app(url_path, server=None):
         ),
     ]
 
-    init_callbacks(app)
-    return app.server
-
 
-def create_trend_graph():
-    trend_data = df.resample("1ME")["Итого"].sum().div(10**6).round(decimals=2)
+def create_trend_graph(monthly):
+    # monthly: total sales by month end
+    trend_data = downsample(monthly, trend_max_points)
+    trend_data = trend_data.div(10**6).round(decimals=2)
     figure = px.area(
         trend_data,
         y="Итого",
@@ -147,18 +323,54 @@ def create_trend_graph():
     return figure
 
 
-def create_category_product_bars(customers, cities, date_range):
+def create_category_product_bars(customers, cities, date_range, previous_states):
     if customers is None or cities is None:
-        return {}
+        return {}, {}, None
+
+    data = dataset
+    key = (
+        data.generation,
+        tuple(sorted(set(customers))),
+        tuple(sorted(set(cities))),
+        tuple(date_range),
+    )
+    cached = figure_cache.get(key)
+    if cached is None:
+        # browsers asking for the same figures at once share one build
+        cached = flights.do(key, cache_figures, data.cube, key)
+
+    figures, states = cached
+    if patch_figures and previous_states:
+        with stage("patch"):
+            figures = [
+                patch_figure(figure, state, previous)
+                for figure, state, previous in zip(figures, states, previous_states)
+            ]
+    return *figures, states
+
+
+def cache_figures(cube, key):
+    c_figure, p_figure = build_category_product_bars(cube, *key[1:])
+    with stage("figure"):
+        figures = (c_figure.to_dict(), p_figure.to_dict())
+    with stage("patch"):
+        cached = figures, [figure_state(figure) for figure in figures]
+    figure_cache.set(key, cached)
+    return cached
+
 
-    start_date = pd.Timestamp(dates[date_range[0]]) + pd.DateOffset(days=1)
-    end_date = pd.Timestamp(dates[date_range[1]])
+def build_category_product_bars(cube, customers, cities, date_range):
+    with stage("query"):
+        category_data, product_data = cube.query(customers, cities, date_range)
+    with stage("aggregate"):
+        category_data = top_n(category_data, max_categories, other="Прочее")
+        product_data = top_n(product_data, max_products, other="Прочее")
 
-    ddf = df[start_date:end_date]
-    cc_ddf = ddf[ddf["Заказчик"].isin(customers) & ddf["Город"].isin(cities)]
+    with stage("figure"):
+        return bar_figures(category_data, product_data)
 
-    category_data = cc_ddf.groupby("Категория товара")["Итого"].sum()
 
+def bar_figures(category_data, product_data):
     c_figure = px.bar(
         category_data,
         y="Итого",
@@ -166,7 +378,7 @@ def create_category_product_bars(customers, cities, date_range):
     )
     c_figure.update_traces(textposition="outside")
     c_figure.update_layout(
-        yaxis=dict(title=None, range=[0, max(category_data) * 1.15]),
+        yaxis=dict(title=None, range=[0, max(category_data, default=0) * 1.15]),
         xaxis_title=None,
         margin=dict(l=10, t=50, r=10, b=10),
         title={
@@ -178,7 +390,7 @@ def create_category_product_bars(customers, cities, date_range):
         },
     )
 
-    product_data = cc_ddf.groupby("Товар")["Итого"].sum().sort_values()  # pyright: ignore [reportCallIssue]
+    product_data = product_data.sort_values()
 
     p_figure = px.bar(
         product_data,
@@ -191,7 +403,7 @@ def create_category_product_bars(customers, cities, date_range):
         uniformtext_minsize=8,
         uniformtext_mode="show",
         yaxis=dict(title=None, showticklabels=True, nticks=len(product_data)),
-        xaxis=dict(title=None, range=[0, max(product_data) * 1.15]),
+        xaxis=dict(title=None, range=[0, max(product_data, default=0) * 1.15]),
         margin=dict(l=10, t=50, r=10, b=10),
         title={
             "text": "Продажи товаров",
@@ -208,7 +420,10 @@ def init_callbacks(app):
     app.callback(
         Output("category-bar", "figure"),
         Output("product-bar", "figure"),
+        Output("bar-figure-state", "data"),
         Input("customer-checklist", "value"),
         Input("city-checklist", "value"),
         Input("date-range-slider", "value"),
-    )(create_category_product_bars)
+        State("bar-figure-state", "data"),
+        **background,
+    )(profiled(create_category_product_bars))
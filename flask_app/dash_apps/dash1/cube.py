@@ -0,0 +1,152 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+class SalesCube:
+    # Sales pre-aggregated into (time bin, customer/city segment, category/product
+    # item) with cumulative sums along the time axis. Time bins are cut at every
+    # slider boundary, so any slider window is a difference of two cube slices.
+
+    def __init__(
+        self,
+        df,
+        dates,
+        customer="Заказчик",
+        city="Город",
+        category="Категория товара",
+        product="Товар",
+        value="Итого",
+    ):
+        self.customer_name = customer
+        self.city_name = city
+        self.category_name = category
+        self.product_name = product
+        self.value_name = value
+
+        self.dates = list(dates)
+        self.starts = np.array(
+            [(pd.Timestamp(d) + pd.DateOffset(days=1)).value for d in dates]
+        )
+        self.ends = np.array([pd.Timestamp(d).value for d in dates])
+        # slider windows are closed on both sides, so an end boundary t is the
+        # half-open edge t + 1ns
+        self.edges = np.unique(np.concatenate([self.starts, self.ends + 1]))
+
+        df = df[df[customer].notna() & df[city].notna()]
+        times = df.index.asi8
+        bins = np.searchsorted(self.edges, times, side="right")
+
+        customer_codes, customers = pd.factorize(df[customer], sort=True)
+        city_codes, cities = pd.factorize(df[city], sort=True)
+        segment_keys, segment_codes = np.unique(
+            customer_codes * len(cities) + city_codes, return_inverse=True
+        )
+        self.segments = pd.MultiIndex(
+            levels=[customers, cities],
+            codes=[segment_keys // len(cities), segment_keys % len(cities)],
+        )
+        self.segment_customers = self.segments.get_level_values(0)
+        self.segment_cities = self.segments.get_level_values(1)
+
+        # missing categories/products factorize to -1; they still form items of
+        # their own but are skipped when grouping, like groupby drops NaN keys
+        category_codes, self.categories = pd.factorize(df[category], sort=True)
+        product_codes, self.products = pd.factorize(df[product], sort=True)
+        item_keys, item_codes = np.unique(
+            (category_codes + 1) * (len(self.products) + 1) + product_codes + 1,
+            return_inverse=True,
+        )
+        self.item_categories = item_keys // (len(self.products) + 1) - 1
+        self.item_products = item_keys % (len(self.products) + 1) - 1
+        self.items = pd.MultiIndex(
+            levels=[self.categories, self.products],
+            codes=[self.item_categories, self.item_products],
+        )
+
+        sums, counts = self._aggregate(df, bins, segment_codes, item_codes)
+        self.sums = _cumulative(sums)
+        self.counts = _cumulative(counts)
+
+    def append(self, df, dates):
+        # Returns a new cube that also covers the rows of df, or None when they
+        # move a slider boundary or bring an unseen segment or item and the
+        # cube has to be rebuilt. The original cube is left untouched.
+        if list(dates) != self.dates:
+            return None
+        if df[[self.category_name, self.product_name]].isna().any(axis=None):
+            return None
+
+        df = df[df[self.customer_name].notna() & df[self.city_name].notna()]
+        segment_codes = self.segments.get_indexer(
+            pd.MultiIndex.from_arrays([df[self.customer_name], df[self.city_name]])
+        )
+        item_codes = self.items.get_indexer(
+            pd.MultiIndex.from_arrays([df[self.category_name], df[self.product_name]])
+        )
+        if (segment_codes < 0).any() or (item_codes < 0).any():
+            return None
+
+        bins = np.searchsorted(self.edges, df.index.asi8, side="right")
+        sums, counts = self._aggregate(df, bins, segment_codes, item_codes)
+
+        cube = copy.copy(self)
+        cube.sums = self.sums + _cumulative(sums)
+        cube.counts = self.counts + _cumulative(counts)
+        return cube
+
+    def _aggregate(self, df, bins, segment_codes, item_codes):
+        shape = (len(self.edges) + 1, len(self.segments), len(self.items))
+        flat = np.ravel_multi_index((bins, segment_codes, item_codes), shape)
+        values = df[self.value_name].to_numpy()
+        grouped = pd.Series(values).groupby(flat)
+        totals = grouped.sum()
+        sizes = grouped.size()
+
+        sums = np.zeros(shape, dtype=values.dtype)
+        sums.flat[totals.index.to_numpy()] = totals.to_numpy()
+        counts = np.zeros(shape, dtype=np.int64)
+        counts.flat[sizes.index.to_numpy()] = sizes.to_numpy()
+        return sums, counts
+
+    def query(self, customers, cities, date_range):
+        lo = np.searchsorted(self.edges, self.starts[date_range[0]]) + 1
+        hi = np.searchsorted(self.edges, self.ends[date_range[1]] + 1) + 1
+        hi = max(hi, lo)
+
+        segments = np.isin(self.segment_customers, customers) & np.isin(
+            self.segment_cities, cities
+        )
+        sums = self.sums[hi, segments].sum(axis=0) - self.sums[lo, segments].sum(axis=0)
+        counts = self.counts[hi, segments].sum(axis=0) - self.counts[lo, segments].sum(
+            axis=0
+        )
+
+        category_data = self._group(
+            sums, counts, self.item_categories, self.categories, self.category_name
+        )
+        product_data = self._group(
+            sums, counts, self.item_products, self.products, self.product_name
+        )
+        return category_data, product_data
+
+    def _group(self, sums, counts, item_groups, labels, name):
+        present = item_groups >= 0
+        group_sums = np.zeros(len(labels), dtype=sums.dtype)
+        group_counts = np.zeros(len(labels), dtype=np.int64)
+        np.add.at(group_sums, item_groups[present], sums[present])
+        np.add.at(group_counts, item_groups[present], counts[present])
+
+        observed = group_counts > 0
+        return pd.Series(
+            group_sums[observed],
+            index=pd.Index(labels[observed], name=name),
+            name=self.value_name,
+        )
+
+
+def _cumulative(cube):
+    cumulative = np.zeros((cube.shape[0] + 1,) + cube.shape[1:], dtype=cube.dtype)
+    np.cumsum(cube, axis=0, out=cumulative[1:])
+    return cumulative
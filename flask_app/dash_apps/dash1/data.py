@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ...shared import decategorize
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def load_sales(path, cache_dir=None):
+    cache_path = _cache_path(path, cache_dir)
+    stat = os.stat(path)
+    signature = {
+        "version": CACHE_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+    meta = _read_meta(cache_path)
+    if meta is not None and _same_stat(meta, signature):
+        frame = _read_frame(cache_path)
+        if frame is not None:
+            return frame
+
+    signature["sha256"] = _file_digest(path)
+    if meta is not None and meta.get("sha256") == signature["sha256"]:
+        # touched but not modified: keep the columns, refresh the stat signature
+        frame = _read_frame(cache_path)
+        if frame is not None:
+            _write_frame(cache_path, frame, signature)
+            return frame
+
+    frame = pd.read_excel(path)
+    _write_frame(cache_path, frame, signature)
+    return frame
+
+
+def appended_rows(old, new):
+    # rows added to the end of the workbook, or None when earlier rows changed
+    if len(new) < len(old) or not new.columns.equals(old.columns):
+        return None
+    # compare text as plain values, shared frames may differ only in categories
+    if not decategorize(new.iloc[: len(old)]).equals(decategorize(old)):
+        return None
+    return new.iloc[len(old) :]
+
+
+class SalesWatcher(threading.Thread):
+    def __init__(self, path, callback, interval=5.0):
+        super().__init__(name="sales-watcher", daemon=True)
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        signature = _stat(self.path)
+        pending = None
+        while not self._stopped.wait(self.interval):
+            current = _stat(self.path)
+            if current is None or current == signature:
+                pending = None
+                continue
+            # only reload once the file has stopped changing between two polls
+            if current != pending:
+                pending = current
+                continue
+            signature, pending = current, None
+            try:
+                self.callback()
+            except Exception:
+                logger.exception("Failed to reload %s", self.path)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def source_signature(path):
+    # identifies the workbook version a shared dataset was built from
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cache_path(path, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), ".cache")
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, name + ".npz")
+
+
+def _same_stat(meta, signature):
+    return all(meta.get(key) == signature[key] for key in signature)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(cache_path):
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            return json.loads(str(npz["__meta__"]))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def _read_frame(cache_path):
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            columns = {}
+            for i, name in enumerate(npz["__columns__"]):
+                key = f"c{i}"
+                if key + ".codes" in npz.files:
+                    values = pd.Categorical.from_codes(
+                        npz[key + ".codes"], npz[key + ".categories"]
+                    )
+                    columns[str(name)] = np.asarray(values, dtype=object)
+                else:
+                    columns[str(name)] = npz[key]
+            return pd.DataFrame(columns)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        logger.warning("Unreadable sales cache %s, rebuilding", cache_path)
+        return None
+
+
+def _write_frame(cache_path, frame, signature):
+    arrays = {
+        "__meta__": np.array(json.dumps(signature)),
+        "__columns__": np.array([str(name) for name in frame.columns]),
+    }
+    for i, name in enumerate(frame.columns):
+        key = f"c{i}"
+        column = frame[name]
+        if column.dtype == object:
+            if not column.map(lambda v: isinstance(v, str)).all():
+                logger.warning("Column %r is not cacheable, skipping sales cache", name)
+                return
+            codes, categories = pd.factorize(column)
+            arrays[key + ".codes"] = codes.astype(np.int32)
+            arrays[key + ".categories"] = np.asarray(categories, dtype=str)
+        else:
+            arrays[key] = column.to_numpy()
+
+    # write to a private file first so concurrent workers never read a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        logger.warning("Could not write sales cache %s", cache_path, exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,234 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import column, delete, func, insert, select, table
+from sqlalchemy.dialects.postgresql import insert as upsert
+
+from ...models import Sale, TableVersion
+
+logger = logging.getLogger(__name__)
+
+# workbook column -> sales table column
+COLUMNS = {
+    "Дата": "date",
+    "Заказчик": "customer",
+    "Город": "city",
+    "Категория товара": "category",
+    "Товар": "product",
+    "Цена за упаковку": "price",
+    "Количество": "quantity",
+    "Итого": "total",
+}
+NAMES = {name: label for label, name in COLUMNS.items()}
+
+sales = Sale.__table__
+versions = TableVersion.__table__
+
+# Materialized views over the sales table, refreshed by every import. The
+# dashboard reads only these: one row per month and customer/city/category/
+# product combination, and one per month for the trend and the slider.
+monthly = table(
+    "sales_monthly",
+    column("month"),
+    column("customer"),
+    column("city"),
+    column("category"),
+    column("product"),
+    column("total"),
+    column("sales"),
+    column("first_id"),
+)
+monthly_totals = table(
+    "sales_monthly_totals",
+    column("month"),
+    column("first_date"),
+    column("total"),
+    column("sales"),
+)
+
+ROLLUPS = [
+    (
+        monthly.name,
+        "select date_trunc('month', date) as month, customer, city, category,"
+        " product, sum(total)::bigint as total, count(*) as sales,"
+        " min(id) as first_id from sales group by 1, 2, 3, 4, 5",
+        "month, customer, city, category, product",
+    ),
+    (
+        monthly_totals.name,
+        "select date_trunc('month', date) as month, min(date) as first_date,"
+        " sum(total)::bigint as total, count(*) as sales"
+        " from sales group by 1",
+        "month",
+    ),
+]
+
+
+def install_rollups(conn):
+    for name, query, key in ROLLUPS:
+        conn.exec_driver_sql(
+            f"create materialized view if not exists {name} as {query}"
+        )
+        conn.exec_driver_sql(
+            f"create unique index if not exists ix_{name} on {name} ({key})"
+        )
+
+
+def replace_sales(conn, frame):
+    # Swaps in the rows of the workbook frame and refreshes the rollups in the
+    # caller's transaction, so readers see the old data until it commits.
+    rows = frame[list(COLUMNS)].rename(columns=COLUMNS)
+    rows = rows.astype(object).where(rows.notna(), None)
+    conn.execute(delete(sales))
+    if len(rows):
+        conn.execute(
+            insert(sales),
+            [{"id": i, **row} for i, row in enumerate(rows.to_dict("records"), 1)],
+        )
+    install_rollups(conn)
+    for name, _, _ in ROLLUPS:
+        # the unique indexes let the refresh diff the views instead of
+        # rewriting them under an exclusive lock
+        conn.exec_driver_sql(f"refresh materialized view concurrently {name}")
+    conn.execute(
+        upsert(versions)
+        .values(name=sales.name, version=1)
+        .on_conflict_do_update(
+            index_elements=[versions.c.name],
+            set_={"version": versions.c.version + 1},
+        )
+    )
+    return len(rows)
+
+
+def generation(conn):
+    # bumped by every import, even one that only relabels rows
+    return conn.execute(
+        select(func.coalesce(func.max(versions.c.version), 0)).where(
+            versions.c.name == sales.name
+        )
+    ).scalar_one()
+
+
+def months(conn):
+    # the months with sales and the first sale date
+    rows = conn.execute(
+        select(monthly_totals.c.month, monthly_totals.c.first_date).order_by(
+            monthly_totals.c.month
+        )
+    ).all()
+    if not rows:
+        return pd.PeriodIndex([], freq="M"), None
+    periods = pd.PeriodIndex([month for month, _ in rows], freq="M")
+    return periods, pd.Timestamp(min(first for _, first in rows))
+
+
+def segments(conn):
+    # customers and cities in order of their first sale, like unique() gives
+    def values(name):
+        key = monthly.c[name]
+        rows = conn.execute(
+            select(key)
+            .where(key.is_not(None))
+            .group_by(key)
+            .order_by(func.min(monthly.c.first_id))
+        )
+        return np.asarray(rows.scalars().all(), dtype=object)
+
+    return values("customer"), values("city")
+
+
+def trend(conn):
+    # monthly totals, labelled and gap-filled like resample("1ME").sum()
+    rows = conn.execute(
+        select(monthly_totals.c.month, monthly_totals.c.total).order_by(
+            monthly_totals.c.month
+        )
+    ).all()
+    index = pd.DatetimeIndex([month for month, _ in rows]) + pd.offsets.MonthEnd(0)
+    series = pd.Series([total for _, total in rows], index=index, name=NAMES["total"])
+    if len(series):
+        series = series.reindex(
+            pd.date_range(index[0], index[-1], freq="ME"), fill_value=0
+        )
+    series.index.name = NAMES["date"]
+    return series
+
+
+class SalesRollup:
+    # SalesCube.query() answered by Postgres from the monthly rollup. Slider
+    # windows are whole months, the bounds are month ends; the category and
+    # product totals come from one grouping-sets query.
+
+    def __init__(self, engine, dates):
+        self.engine = engine
+        self.dates = list(dates)
+
+    def query(self, customers, cities, date_range):
+        start = self._month(date_range[0])
+        end = self._month(date_range[1])
+        by_product = func.grouping(monthly.c.category).label("by_product")
+        statement = (
+            select(
+                by_product,
+                monthly.c.category,
+                monthly.c.product,
+                func.sum(monthly.c.total).label("total"),
+            )
+            .where(
+                monthly.c.month >= start,
+                monthly.c.month < end,
+                monthly.c.customer.in_(list(customers)),
+                monthly.c.city.in_(list(cities)),
+            )
+            .group_by(func.grouping_sets(monthly.c.category, monthly.c.product))
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(statement).all()
+
+        category_data = self._group(
+            [(r.category, r.total) for r in rows if not r.by_product], "category"
+        )
+        product_data = self._group(
+            [(r.product, r.total) for r in rows if r.by_product], "product"
+        )
+        return category_data, product_data
+
+    def _month(self, position):
+        # the month starting the day after the slider date at this position
+        day = pd.Timestamp(self.dates[position]) + pd.DateOffset(days=1)
+        return day.replace(day=1).to_pydatetime()
+
+    def _group(self, pairs, name):
+        # rows without a category or product are left out, like the cube does
+        pairs = [(label, total) for label, total in pairs if label is not None]
+        series = pd.Series(
+            [int(total) for _, total in pairs],
+            index=pd.Index([label for label, _ in pairs], name=NAMES[name]),
+            name=NAMES["total"],
+            dtype=np.int64,
+        )
+        return series.sort_index()
+
+
+class RollupWatcher(threading.Thread):
+    # Calls back every interval; the callback compares the rollup generation
+    # with its dataset's, a query on a few rows per month of sales.
+
+    def __init__(self, callback, interval=5.0):
+        super().__init__(name="sales-rollup-watcher", daemon=True)
+        self.callback = callback
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.callback()
+            except Exception:
+                logger.exception("Failed to reload the sales rollups")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+from ...database import database_url
+from . import query
+
+_lock = threading.Lock()
+_loop = None
+_engine = None
+
+
+def start(**engine_options):
+    # The async engine and its connection pool live on one long-running loop.
+    # Flask runs every async view in a fresh event loop, and asyncpg
+    # connections cannot be shared between loops.
+    # imported here so the sync path runs without greenlet and asyncpg installed
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    global _loop, _engine
+    with _lock:
+        if _loop is not None:
+            return
+        _loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=_loop.run_forever, name="dash2-db-loop", daemon=True
+        ).start()
+        _engine = create_async_engine(
+            database_url("asyncpg", read=True), **engine_options
+        )
+
+
+def run(coroutine):
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, _loop))
+
+
+def run_sync(coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+
+async def page_and_count(plan, page_current, page_size, records_count):
+    # page and count go out on separate connections at the same time
+    if records_count is None:
+        return await asyncio.gather(
+            fetch_page(plan, page_current, page_size), count_records(plan)
+        )
+    return await fetch_page(plan, page_current, page_size), records_count
+
+
+async def fetch_page(plan, page_current, page_size):
+    if plan.seek is not None:
+        kind, boundary = plan.seek
+        records = await fetch_records(
+            query.page_statement(plan.filter_shape, plan.sort_columns, kind),
+            {**plan.params, **query.seek_params(boundary), "limit": page_size},
+        )
+        if records:
+            return records[::-1] if kind == "before" else records
+
+    return await fetch_records(
+        query.page_statement(plan.filter_shape, plan.sort_columns),
+        {**plan.params, "offset": page_current * page_size, "limit": page_size},
+    )
+
+
+async def count_records(plan):
+    async with _engine.connect() as conn:
+        result = await conn.execute(
+            query.count_statement(plan.filter_shape), plan.params
+        )
+        return result.scalar()
+
+
+async def fetch_records(statement, params):
+    async with _engine.connect() as conn:
+        result = await conn.execute(statement, params)
+        return [dict(row) for row in result.mappings()]
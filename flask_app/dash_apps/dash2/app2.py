@@ -1,23 +1,98 @@
+import re
+from collections import namedtuple
 from math import ceil
 
 import dash_bootstrap_components as dbc
-import pandas as pd
-from dash import Dash, Input, Output, dash_table, html
+from dash import Dash, Input, Output, State, dash_table, dcc, html
 from dash.dash_table.Format import Format, Group, Symbol
-from flask import g
+from sqlalchemy import event
+
+from ... import metrics
+from ...cache import LRUCache, SingleFlight, canonical_key
+from ...database import engine, engine_options, read_session
+from ...profiling import profiled, stage
+from ..background import background_options
+from ..encoding import RECORDS_FROM_COLUMNS, columnar, record_columns
+from . import aio, query
+from .memory import MemoryTable, MemoryTableRefresher, install_notify_trigger
+from .prefetch import PagePrefetcher
 
 
 def init_app(url_path, server=None):
     global df
+    # dash2 only reads, so it always uses the read engine; writes by other
+    # parts of the app still go through the primary and invalidate the caches
     global session
-    session = g.session
+    session = read_session
+
+    global use_async
+    use_async = bool(server is not None and server.config.get("DASH2_ASYNC", False))
 
     app = Dash(
         __name__,
         server=server,
         routes_pathname_prefix=url_path,
         external_stylesheets=[dbc.themes.BOOTSTRAP],
+        use_async=use_async,
+    )
+    global async_engine_options
+    async_engine_options = {
+        **engine_options(),
+        "pool_size": app.server.config.get("DASH2_ASYNC_POOL_SIZE", 10),
+    }
+
+    global flights, background
+    flights = SingleFlight()
+    metrics.gauge(
+        "dash2_pages_shared",
+        "table pages taken from an identical call in flight",
+        lambda: flights.shared,
+    )
+    # results are kept for `expire` seconds and writes do not evict them
+    background = background_options(
+        app.server,
+        "DASH2",
+        expire=app.server.config.get("DASH2_BACKGROUND_EXPIRE", 5),
+    )
+
+    global keyset_pagination
+    keyset_pagination = app.server.config.get("DASH2_KEYSET_PAGINATION", True)
+
+    global count_cache, count_window, estimated_counts, estimate_threshold
+    count_cache = LRUCache(
+        maxsize=app.server.config.get("DASH2_COUNT_CACHE_SIZE", 1024),
+        ttl=app.server.config.get("DASH2_COUNT_CACHE_TTL", 300),
     )
+    count_window = app.server.config.get("DASH2_COUNT_WINDOW", False)
+    estimated_counts = app.server.config.get("DASH2_ESTIMATED_COUNTS", False)
+    estimate_threshold = app.server.config.get("DASH2_ESTIMATE_THRESHOLD", 100_000)
+    event.listen(engine, "after_cursor_execute", invalidate_caches)
+
+    global prefetcher
+    prefetcher = None
+    prefetch_pages = app.server.config.get("DASH2_PREFETCH_PAGES", 0)
+    if prefetch_pages:
+        prefetcher = PagePrefetcher(
+            prefetch_pages,
+            maxsize=app.server.config.get("DASH2_PREFETCH_CACHE_SIZE", 256),
+            ttl=app.server.config.get("DASH2_PREFETCH_CACHE_TTL", 60),
+            cleanup=session.remove,
+        )
+
+    global memory_table
+    memory_table = None
+    if app.server.config.get("DASH2_BACKEND", "postgres") == "memory":
+        channel = app.server.config.get("DASH2_MEMORY_NOTIFY_CHANNEL")
+        if channel:
+            with engine.begin() as conn:
+                install_notify_trigger(conn, channel)
+        memory_table = MemoryTableRefresher(
+            load_memory_table,
+            interval=app.server.config.get("DASH2_MEMORY_REFRESH_INTERVAL", 300),
+            # notifications are not replicated, so listen on the primary
+            engine=engine,
+            channel=channel,
+        )
 
     PAGE_SIZE = 10
 
@@ -31,6 +106,7 @@ def init_app(url_path, server=None):
         ),
         html.H2("GapMinder 2025"),
         html.Hr(),
+        dcc.Store(id="table-page"),
         dash_table.DataTable(
             id="table-sorting-filtering",
             columns=[
@@ -89,95 +165,244 @@ def init_app(url_path, server=None):
             sort_mode="single",
             sort_by=[],
         ),
+        dcc.Store(id="table-cursor"),
     ]
 
     init_callbacks(app)
     return app.server
 
 
-operators = [
-    [">=", "ge ", ">="],
-    ["<=", "le ", "<="],
-    ["<", "lt ", "<"],
-    [">", "gt ", ">"],
-    ["<>", "ne ", "!="],
-    ["=", "eq ", "="],
-    ["like", "contains "],
-]
-
-
-def split_filter_part(filter_part):
-    for operator_type in operators:
-        for operator in operator_type:
-            if operator in filter_part:
-                name_part, value_part = filter_part.split(operator, 1)
-                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
-
-                value_part = value_part.strip()
-                v0 = value_part[0]
-                if v0 == value_part[-1] and v0 in ("'", '"', "`"):
-                    value = value_part[1:-1].replace("\\" + v0, v0)
-                else:
-                    try:
-                        value = float(value_part)
-                    except ValueError:
-                        value = value_part
-
-                return name, operator_type[0], value
-
-    return [None] * 3
-
-
-def update_table(page_current, page_size, sort_by, filter):
-    filtering_expressions = filter.split(" && ")
-    query_filter_parts = []
-    for filter_part in filtering_expressions:
-        col_name, operator, filter_value = split_filter_part(filter_part)
-        if col_name is None:
-            continue
-        if operator in ("=", "<>", "<", "<=", ">", ">="):
-            query_filter_parts.append(
-                col_name + " " + operator + " " + str(filter_value)
-            )
-        elif operator == "like":
-            query_filter_parts.append(col_name + " like '%%" + filter_value + "%%'")
-
-    query_filter = " and ".join(query_filter_parts)
-    if len(query_filter):
-        query_filter = " where " + query_filter
-
-    sorting = ""
-    if len(sort_by):
-        sorting_parts = [col["column_id"] + " " + col["direction"] for col in sort_by]
-        sorting = " order by " + ", ".join(sorting_parts)
-
-    data_query = (
-        "select country, population, life_exp, gdp_percap from gapminder"
-        + query_filter
-        + sorting
-        + " offset "
-        + str(page_current * page_size)
-        + " limit "
-        + str(page_size)
+def start():
+    if memory_table is not None:
+        memory_table.start()
+    if use_async:
+        aio.start(**async_engine_options)
+
+
+PagePlan = namedtuple(
+    "PagePlan",
+    "filters filter_shape params count_key sort_columns cursor_key seek",
+)
+
+
+def plan_page(page_current, page_size, sort_by, filter, cursor):
+    filters = query.parse_filter(filter)
+    sort_columns = query.sort_columns(sort_by)
+    cursor_key = [filter, sort_by, page_size]
+    seek = None
+    same_direction = len({direction for _, direction in sort_columns}) == 1
+    if keyset_pagination and same_direction and cursor and cursor["key"] == cursor_key:
+        seek = seek_from_cursor(cursor, page_current)
+
+    return PagePlan(
+        filters=filters,
+        filter_shape=tuple((name, operator) for name, operator, _ in filters),
+        params=query.filter_params(filters),
+        count_key=tuple(sorted(set(filters))),
+        sort_columns=sort_columns,
+        cursor_key=cursor_key,
+        seek=seek,
     )
 
-    count_query = "select count(id) from gapminder" + query_filter
 
-    records_count = 0
-    with session.connection() as conn:
-        df = pd.read_sql_query(data_query, conn)
-        records_count = pd.read_sql_query(count_query, conn)
+def memory_page(plan, page_current, page_size):
+    with stage("memory"):
+        columns, records_count = memory_table.table.query(
+            plan.filters, plan.sort_columns, page_current * page_size, page_size
+        )
+    with stage("encode"):
+        page = columnar(columns)
+    return page, ceil(records_count / page_size), None
+
+
+def page_result(plan, page_current, page_size, records, records_count):
+    cursor = None
+    if records:
+        cursor = {
+            "key": plan.cursor_key,
+            "page": page_current,
+            "first": [records[0][column] for column, _ in plan.sort_columns],
+            "last": [records[-1][column] for column, _ in plan.sort_columns],
+        }
+
+    with stage("encode"):
+        names = [column.name for column in query.RESULT_COLUMNS]
+        page = columnar(record_columns(records, names))
+    page_count = ceil(records_count / page_size)
+    return page, page_count, cursor
+
+
+def update_table(page_current, page_size, sort_by, filter, cursor):
+    # browsers asking for the same page at once share one query
+    args = page_current, page_size, sort_by, filter, cursor
+    return flights.do(canonical_key(*args), load_table, *args)
+
+
+async def update_table_async(page_current, page_size, sort_by, filter, cursor):
+    args = page_current, page_size, sort_by, filter, cursor
+    return await flights.do_async(canonical_key(*args), load_table_async, *args)
+
+
+def load_table(page_current, page_size, sort_by, filter, cursor):
+    with stage("plan"):
+        plan = plan_page(page_current, page_size, sort_by, filter, cursor)
+    if memory_table is not None:
+        return memory_page(plan, page_current, page_size)
+
+    records_count = count_cache.get(plan.count_key)
+    cached_count = records_count is not None
+    window_count = count_window and not cached_count and prefetcher is None
+
+    with stage("sql"), session.connection() as conn:
+        records = None
+        if prefetcher is not None:
+            records = prefetcher.page(
+                (plan.count_key, plan.sort_columns, page_size),
+                page_current,
+                page_size,
+                window_loader(plan.filter_shape, plan.params, plan.sort_columns),
+            )
+        elif plan.seek is not None:
+            kind, boundary = plan.seek
+            records = query.fetch_records(
+                conn,
+                query.page_statement(plan.filter_shape, plan.sort_columns, kind),
+                {**plan.params, **query.seek_params(boundary), "limit": page_size},
+            )
+            if kind == "before":
+                records.reverse()
+        # rows around the cursor may have been deleted since the last page
+        if records is None or (plan.seek is not None and not records):
+            records = query.fetch_records(
+                conn,
+                query.page_statement(
+                    plan.filter_shape, plan.sort_columns, window_count=window_count
+                ),
+                {
+                    **plan.params,
+                    "offset": page_current * page_size,
+                    "limit": page_size,
+                },
+            )
+            if window_count and records:
+                records_count = records[0]["records_count"]
+        if records_count is None:
+            records_count = count_records(conn, plan.filter_shape, plan.params)
+
+    if not cached_count:
+        count_cache.set(plan.count_key, records_count)
+    return page_result(plan, page_current, page_size, records, records_count)
+
+
+async def load_table_async(page_current, page_size, sort_by, filter, cursor):
+    with stage("plan"):
+        plan = plan_page(page_current, page_size, sort_by, filter, cursor)
+    if memory_table is not None:
+        return memory_page(plan, page_current, page_size)
+
+    records_count = count_cache.get(plan.count_key)
+    cached_count = records_count is not None
+    with stage("sql"):
+        records, records_count = await aio.run(
+            aio.page_and_count(plan, page_current, page_size, records_count)
+        )
+
+    if not cached_count:
+        count_cache.set(plan.count_key, records_count)
+    return page_result(plan, page_current, page_size, records, records_count)
+
+
+def load_memory_table():
+    try:
+        return MemoryTable.load(session.connection())
+    finally:
+        session.remove()
+
+
+def window_loader(filter_shape, params, sort_columns):
+    def load(limit, offset=0, after=None, before=None):
+        boundary = after or before
+        if boundary is None:
+            statement = query.page_statement(filter_shape, sort_columns)
+            window_params = {**params, "offset": offset, "limit": limit}
+        else:
+            seek = "after" if after else "before"
+            statement = query.page_statement(filter_shape, sort_columns, seek)
+            window_params = {
+                **params,
+                **query.seek_params([boundary[column] for column, _ in sort_columns]),
+                "limit": limit,
+            }
+        # no context manager: this runs inside update_table's connection block
+        # as well as on prefetch threads, which remove their session afterwards
+        records = query.fetch_records(session.connection(), statement, window_params)
+        return records[::-1] if before else records
 
-    page_count = ceil(records_count.iloc[0, 0] / page_size)
-    return df.to_dict("records"), page_count
+    return load
+
+
+def count_records(conn, filter_shape, params):
+    if estimated_counts:
+        if filter_shape:
+            compiled = query.match_statement(filter_shape).compile(conn)
+            plan = conn.exec_driver_sql(
+                "explain (format json) " + str(compiled),
+                compiled.construct_params(params),
+            ).scalar()
+            estimate = plan[0]["Plan"]["Plan Rows"]
+        else:
+            estimate = conn.exec_driver_sql(
+                "select reltuples::bigint from pg_class"
+                " where oid = 'gapminder'::regclass"
+            ).scalar()
+        # small results are cheap to count exactly and estimates are coarse there
+        if estimate >= estimate_threshold:
+            return estimate
+
+    return conn.execute(query.count_statement(filter_shape), params).scalar()
+
+
+WRITE_STATEMENT = re.compile(
+    r"^\s*(insert\s+into|update|delete\s+from|truncate(\s+table)?)\s+\"?gapminder\b",
+    re.IGNORECASE,
+)
+
+
+def invalidate_caches(conn, cursor, statement, parameters, context, executemany):
+    if WRITE_STATEMENT.match(statement):
+        count_cache.clear()
+        if prefetcher is not None:
+            prefetcher.clear()
+        if memory_table is not None:
+            memory_table.notify()
+
+
+def seek_from_cursor(cursor, page_current):
+    if page_current == cursor["page"] + 1:
+        return "after", cursor["last"]
+    if page_current == cursor["page"] - 1:
+        return "before", cursor["first"]
+    if page_current == cursor["page"]:
+        return "from", cursor["first"]
+    return None
 
 
 def init_callbacks(app):
     app.callback(
-        Output("table-sorting-filtering", "data"),
+        Output("table-page", "data"),
         Output("table-sorting-filtering", "page_count"),
+        Output("table-cursor", "data"),
         Input("table-sorting-filtering", "page_current"),
         Input("table-sorting-filtering", "page_size"),
         Input("table-sorting-filtering", "sort_by"),
         Input("table-sorting-filtering", "filter_query"),
-    )(update_table)
+        State("table-cursor", "data"),
+        **background,
+    )(profiled(update_table_async if use_async else update_table))
+
+    # pages arrive as columns, the table wants rows
+    app.clientside_callback(
+        RECORDS_FROM_COLUMNS,
+        Output("table-sorting-filtering", "data"),
+        Input("table-page", "data"),
+    )
@@ -0,0 +1,192 @@
+import logging
+import re
+import select as selectors
+import threading
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import Text, select
+
+from . import query
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+
+
+class MemoryTable:
+    # gapminder held as typed NumPy columns with one ascending (value, id)
+    # permutation per column; descending order is the reversed permutation,
+    # which matches the "column desc, id desc" ordering of the SQL backend.
+    # Text columns are compared by code point, not by the database collation.
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.size = len(columns["id"])
+        self.orders = {}
+        self.sorted_keys = {}
+        self.text = {}
+        for name, values in columns.items():
+            if values.dtype == object:
+                self.text[name] = TextIndex(values)
+                keys = self.text[name].codes
+            else:
+                keys = values
+            order = np.lexsort((columns["id"], keys))
+            self.orders[name] = order
+            self.sorted_keys[name] = keys[order]
+
+    @classmethod
+    def load(cls, conn):
+        rows = conn.execute(select(*query.RESULT_COLUMNS)).all()
+        values = list(zip(*rows)) or [()] * len(query.RESULT_COLUMNS)
+        columns = {}
+        for column, column_values in zip(query.RESULT_COLUMNS, values):
+            if isinstance(column.type, Text):
+                columns[column.name] = np.array(column_values, dtype=object)
+            else:
+                columns[column.name] = np.array(
+                    column_values, dtype=np.dtype(column.type.python_type)
+                )
+        return cls(columns)
+
+    def query(self, filters, sort_columns, offset, limit):
+        mask = None
+        for name, operator, value in filters:
+            condition = self._filter(name, operator, value)
+            mask = condition if mask is None else mask & condition
+
+        name, direction = sort_columns[0]
+        order = self.orders[name]
+        if direction == "desc":
+            order = order[::-1]
+        rows = order if mask is None else order[mask[order]]
+        page = rows[offset : offset + limit]
+        return {name: values[page] for name, values in self.columns.items()}, len(rows)
+
+    def _filter(self, name, operator, value):
+        values = self.columns[name]
+        if operator == "like":
+            if name in self.text:
+                return self.text[name].contains(value)
+            return np.char.find(values.astype(str), value) >= 0
+
+        def position(side):
+            if name in self.text:
+                code = np.searchsorted(self.text[name].uniques, value, side)
+                return np.searchsorted(self.sorted_keys[name], code, "left")
+            return np.searchsorted(self.sorted_keys[name], value, side)
+
+        lo, hi = {
+            ">=": lambda: (position("left"), self.size),
+            ">": lambda: (position("right"), self.size),
+            "<": lambda: (0, position("left")),
+            "<=": lambda: (0, position("right")),
+            "=": lambda: (position("left"), position("right")),
+            "<>": lambda: (position("left"), position("right")),
+        }[operator]()
+
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.orders[name][lo:hi]] = True
+        return ~mask if operator == "<>" else mask
+
+
+class TextIndex:
+    def __init__(self, values):
+        self.uniques, self.codes = np.unique(values.astype(str), return_inverse=True)
+        grams = defaultdict(list)
+        for i, value in enumerate(self.uniques):
+            for gram in set(_ngrams(value)):
+                grams[gram].append(i)
+        self.grams = {gram: np.array(ids) for gram, ids in grams.items()}
+
+    def contains(self, needle):
+        if len(needle) >= NGRAM:
+            candidates = None
+            for gram in set(_ngrams(needle)):
+                ids = self.grams.get(gram)
+                if ids is None:
+                    return np.zeros(len(self.codes), dtype=bool)
+                if candidates is not None:
+                    ids = np.intersect1d(candidates, ids)
+                candidates = ids
+        else:
+            candidates = range(len(self.uniques))
+        matched = [i for i in candidates if needle in self.uniques[i]]
+        return np.isin(self.codes, matched)
+
+
+def _ngrams(value):
+    return (value[i : i + NGRAM] for i in range(len(value) - NGRAM + 1))
+
+
+class MemoryTableRefresher(threading.Thread):
+    def __init__(self, load, interval=300, engine=None, channel=None):
+        super().__init__(name="dash2-memory-refresh", daemon=True)
+        self.load = load
+        self.interval = interval
+        self.table = load()
+        self.engine = engine
+        self.channel = channel
+        self._changed = threading.Event()
+        if channel is not None:
+            check_channel(channel)
+
+    def run(self):
+        if self.channel is not None:
+            threading.Thread(
+                target=self._listen,
+                args=(self.engine, self.channel),
+                name="dash2-memory-listen",
+                daemon=True,
+            ).start()
+        while True:
+            self._changed.wait(self.interval)
+            self._changed.clear()
+            try:
+                # swap the whole table; requests keep the one they started with
+                self.table = self.load()
+            except Exception:
+                logger.exception("Refreshing the in-memory gapminder table failed")
+
+    def notify(self):
+        self._changed.set()
+
+    def _listen(self, engine, channel):
+        conn = engine.raw_connection()
+        try:
+            conn.driver_connection.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"listen {channel}")
+            driver_connection = conn.driver_connection
+            while True:
+                if selectors.select([driver_connection], [], [], 60) == ([], [], []):
+                    continue
+                driver_connection.poll()
+                if driver_connection.notifies:
+                    driver_connection.notifies.clear()
+                    self.notify()
+        except Exception:
+            logger.exception("Listening for gapminder changes failed")
+        finally:
+            conn.close()
+
+
+def check_channel(channel):
+    if not re.fullmatch(r"[a-z_][a-z0-9_]*", channel):
+        raise ValueError(f"Invalid notification channel {channel!r}")
+
+
+def install_notify_trigger(conn, channel):
+    check_channel(channel)
+    conn.exec_driver_sql(
+        "create or replace function gapminder_notify() returns trigger"
+        " language plpgsql as $$ begin"
+        f" perform pg_notify('{channel}', tg_op); return null;"
+        " end $$"
+    )
+    conn.exec_driver_sql(
+        "create or replace trigger gapminder_notify"
+        " after insert or update or delete or truncate on gapminder"
+        " for each statement execute function gapminder_notify()"
+    )
@@ -0,0 +1,122 @@
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ... import metrics
+from ...cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# a run of consecutive rows starting at the first row of page `start`;
+# `end` is set once the run reaches the last matching row
+Window = namedtuple("Window", "start records end")
+
+
+class PagePrefetcher:
+    def __init__(self, radius, maxsize=256, ttl=60, cleanup=None):
+        self.radius = radius
+        self.windows = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.cleanup = cleanup
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="dash2-prefetch"
+        )
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("dash2_prefetch_hits", "pages served from memory")
+        self.misses = metrics.counter("dash2_prefetch_misses", "pages loaded from db")
+        self.refills = metrics.counter("dash2_prefetch_refills", "background refills")
+        metrics.gauge(
+            "dash2_prefetch_hit_rate",
+            "share of page requests served from memory",
+            lambda: self.hits.value / ((self.hits.value + self.misses.value) or 1),
+        )
+        # every hit is a page query the database did not have to run
+        metrics.gauge(
+            "dash2_prefetch_queries_saved",
+            "page queries avoided by prefetching",
+            lambda: self.hits.value,
+        )
+
+    def page(self, key, page, page_size, load):
+        window = self.windows.get(key)
+        records = _slice(window, page, page_size)
+        if records is None:
+            self.misses.inc()
+            start = max(0, page - self.radius)
+            limit = (page - start + self.radius + 1) * page_size
+            fetched = load(limit, offset=start * page_size)
+            window = Window(start, fetched, len(fetched) < limit)
+            self.windows.set(key, window)
+            records = _slice(window, page, page_size) or []
+        else:
+            self.hits.inc()
+
+        last_page = window.start + len(window.records) // page_size - 1
+        if page >= last_page - 1 and not window.end:
+            self._refill(key, page_size, load, forward=True)
+        elif page <= window.start + 1 and window.start > 0:
+            self._refill(key, page_size, load, forward=False)
+        return records
+
+    def clear(self):
+        self.windows.clear()
+
+    def _refill(self, key, page_size, load, forward):
+        with self._lock:
+            if (key, forward) in self._refilling:
+                return
+            self._refilling.add((key, forward))
+        self.refills.inc()
+        self._executor.submit(self._extend, key, page_size, load, forward)
+
+    def _extend(self, key, page_size, load, forward):
+        try:
+            window = self.windows.get(key)
+            if window is None or not window.records:
+                return
+            max_records = (4 * self.radius + 1) * page_size
+            if forward:
+                limit = self.radius * page_size
+                fetched = load(limit, after=window.records[-1])
+                records = window.records + fetched
+                # drop whole pages from the front to stay within the window size
+                dropped = max(0, len(records) - max_records) // page_size
+                window = Window(
+                    window.start + dropped,
+                    records[dropped * page_size :],
+                    len(fetched) < limit,
+                )
+            else:
+                pages = min(self.radius, window.start)
+                fetched = load(pages * page_size, before=window.records[0])
+                if len(fetched) != pages * page_size:
+                    # rows changed under the window, reload it on the next miss
+                    self.windows.pop(key)
+                    return
+                records = fetched + window.records
+                window = Window(
+                    window.start - pages,
+                    records[:max_records],
+                    window.end and len(records) <= max_records,
+                )
+            self.windows.set(key, window)
+        except Exception:
+            logger.exception("Prefetching dash2 pages failed")
+        finally:
+            with self._lock:
+                self._refilling.discard((key, forward))
+            if self.cleanup is not None:
+                self.cleanup()
+
+
+def _slice(window, page, page_size):
+    if window is None or page < window.start:
+        return None
+    offset = (page - window.start) * page_size
+    if offset >= len(window.records) and not (window.end and offset == 0):
+        return None
+    if offset + page_size > len(window.records) and not window.end:
+        return None
+    return window.records[offset : offset + page_size]
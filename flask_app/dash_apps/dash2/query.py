@@ -0,0 +1,176 @@
+import operator as op
+from functools import lru_cache
+
+from sqlalchemy import Text, bindparam, func, select, tuple_
+
+from ...models import Gapminder
+
+table = Gapminder.__table__
+
+# only these columns may appear in filter_query and sort_by
+COLUMNS = {
+    name: table.c[name] for name in ("country", "population", "life_exp", "gdp_percap")
+}
+RESULT_COLUMNS = (table.c.id, *COLUMNS.values())
+
+operators = [
+    [">=", "ge ", ">="],
+    ["<=", "le ", "<="],
+    ["<", "lt ", "<"],
+    [">", "gt ", ">"],
+    ["<>", "ne ", "!="],
+    ["=", "eq ", "="],
+    ["like", "contains "],
+]
+
+LIKE_ESCAPE = "/"
+
+COMPARISONS = {
+    ">=": op.ge,
+    "<=": op.le,
+    "<": op.lt,
+    ">": op.gt,
+    "<>": op.ne,
+    "=": op.eq,
+}
+
+
+def split_filter_part(filter_part):
+    for operator_type in operators:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+
+                value_part = value_part.strip()
+                v0 = value_part[0]
+                if v0 == value_part[-1] and v0 in ("'", '"', "`"):
+                    value_part = value_part[1:-1].replace("\\" + v0, v0)
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # the operand as typed is kept for text and LIKE comparisons
+                return name, operator_type[0], value, value_part
+
+    return [None] * 4
+
+
+def parse_filter(filter_query):
+    filters = []
+    for filter_part in filter_query.split(" && "):
+        name, operator, value, raw = split_filter_part(filter_part)
+        if name not in COLUMNS:
+            continue
+        value = coerce_value(COLUMNS[name], operator, value, raw)
+        if value is not None:
+            filters.append((name, operator, value))
+    return filters
+
+
+def coerce_value(column, operator, value, raw):
+    if operator == "like" or isinstance(column.type, Text):
+        return raw
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def filter_params(filters):
+    params = {}
+    for i, (_, operator, value) in enumerate(filters):
+        if operator == "like":
+            for char in (LIKE_ESCAPE, "%", "_"):
+                value = value.replace(char, LIKE_ESCAPE + char)
+        params[f"f{i}"] = value
+    return params
+
+
+def filter_conditions(filter_shape):
+    conditions = []
+    for i, (name, operator) in enumerate(filter_shape):
+        column = COLUMNS[name]
+        value = bindparam(f"f{i}")
+        if operator == "like":
+            if not isinstance(column.type, Text):
+                column = column.cast(Text)
+            conditions.append(column.contains(value, escape=LIKE_ESCAPE))
+        else:
+            conditions.append(COMPARISONS[operator](column, value))
+    return conditions
+
+
+def sort_columns(sort_by):
+    # id breaks ties so that every row has a unique position in the ordering
+    columns = [
+        (col["column_id"], col["direction"])
+        for col in sort_by
+        if col["column_id"] in COLUMNS and col["direction"] in ("asc", "desc")
+    ]
+    columns.append(("id", columns[-1][1] if columns else "asc"))
+    return tuple(columns)
+
+
+def seek_params(boundary):
+    return {f"s{i}": value for i, value in enumerate(boundary)}
+
+
+# Statements are cached by shape (filtered columns and operators, ordering and
+# paging mode); values are always bound parameters, so SQLAlchemy's compiled
+# cache and Postgres plans are reused for every filter value.
+
+
+@lru_cache(maxsize=256)
+def page_statement(filter_shape, sort_columns, seek=None, window_count=False):
+    columns = list(RESULT_COLUMNS)
+    if window_count:
+        # the window is evaluated before offset/limit, so it counts every match
+        columns.append(func.count().over().label("records_count"))
+
+    statement = select(*columns).where(*filter_conditions(filter_shape))
+    if seek is not None:
+        statement = statement.where(keyset_condition(sort_columns, seek))
+    else:
+        statement = statement.offset(bindparam("offset"))
+    return statement.order_by(*order_by(sort_columns, seek == "before")).limit(
+        bindparam("limit")
+    )
+
+
+@lru_cache(maxsize=256)
+def count_statement(filter_shape):
+    return select(func.count(table.c.id)).where(*filter_conditions(filter_shape))
+
+
+@lru_cache(maxsize=256)
+def match_statement(filter_shape):
+    # unaggregated and unpaged, so the planner's row estimate is the match count
+    return select(table.c.id).where(*filter_conditions(filter_shape))
+
+
+def keyset_condition(sort_columns, seek):
+    ascending = sort_columns[0][1] == "asc"
+    compare = {
+        "after": op.gt if ascending else op.lt,
+        "before": op.lt if ascending else op.gt,
+        "from": op.ge if ascending else op.le,
+    }[seek]
+    columns = tuple_(*(table.c[name] for name, _ in sort_columns))
+    boundary = tuple_(*(bindparam(f"s{i}") for i in range(len(sort_columns))))
+    return compare(columns, boundary)
+
+
+def order_by(sort_columns, reverse=False):
+    flipped = {"asc": "desc", "desc": "asc"}
+    return [
+        getattr(table.c[name], flipped[direction] if reverse else direction)()
+        for name, direction in sort_columns
+    ]
+
+
+def fetch_records(conn, statement, params):
+    return [dict(row) for row in conn.execute(statement, params).mappings()]
@@ -1,15 +1,31 @@
 import dash_bootstrap_components as dbc
-import pandas as pd
 import plotly.express as px
-from dash import Dash, Input, Output, ctx, dash_table, dcc, html
+from dash import (
+    Dash,
+    Input,
+    Output,
+    Patch,
+    State,
+    ctx,
+    dash_table,
+    dcc,
+    html,
+    no_update,
+)
+from dash.exceptions import PreventUpdate
 from flask import request
+from flask_login import current_user
 
+from ..aggregate import aggregate
+from ..encoding import RECORDS_FROM_COLUMNS, columnar, frame_columns
+from ..figures import figure_state, patch_figure
+from ...database import engine
+from ...profiling import profiled, stage
+from ...shared import SharedFrames
+from .store import DATA_COLUMNS, TableStore, plain_value
 
-def init_app(url_path, server=None):
-    global df
-
-    df = px.data.tips()
 
+def init_app(url_path, server=None):
     app = Dash(
         __name__,
         server=server,
@@ -17,7 +33,21 @@ def init_app(url_path, server=None):
         external_stylesheets=[dbc.themes.BOOTSTRAP],
     )
 
-    app.layout = [
+    global store
+    store = TableStore(engine, SharedFrames(app.server.config.get("SHARED_DATA_DIR")))
+
+    global patch_figures
+    patch_figures = app.server.config.get("DASH_PATCH_FIGURES", True)
+
+    app.layout = serve_layout
+
+    init_callbacks(app)
+    return app.server
+
+
+def serve_layout():
+    version, df = store.snapshot()
+    return [
         html.Nav(
             [
                 html.A("Logout", href="/logout"),
@@ -33,9 +63,9 @@ def init_app(url_path, server=None):
                 dbc.Col(
                     dash_table.DataTable(
                         id="tips-table",
-                        data=df.to_dict("records"),
                         columns=[
-                            {"name": i, "id": i, "selectable": True} for i in df.columns
+                            {"name": i, "id": i, "selectable": True}
+                            for i in DATA_COLUMNS
                         ],
                         column_selectable="single",
                         selected_columns=["tip"],
@@ -47,32 +77,75 @@ def init_app(url_path, server=None):
                 dbc.Col(dcc.Graph(id="total-bill-bar"), width=7),
             ]
         ),
+        # the table itself stays on the server; the browser only holds its
+        # version and sends the cells it changed
+        dcc.Store(id="tips-version", data=version),
+        dcc.Store(id="tips-page", data=columnar(frame_columns(df))),
+        dcc.Store(id="tips-edits"),
+        dcc.Store(id="total-bill-figure-state"),
         dbc.Col(
-            dbc.Row([html.Div(id="table-triggered-message")]),
+            dbc.Row(
+                [
+                    html.Div(id="table-triggered-message"),
+                    html.Div(id="tips-save-message"),
+                ]
+            ),
             width=5,
             style={"textAlign": "center"},
         ),
     ]
 
-    init_callbacks(app)
-    return app.server
 
-
-def update_graph_message(data, selected_column, active_cell):
+def update_graph_message(version, selected_column, active_cell, previous_state):
     triggered_prop_ids = ctx.triggered_prop_ids
 
-    dff = pd.DataFrame(data)
+    with stage("snapshot"):
+        dff = store.snapshot(version).frame
 
     message = "Nothing selected yet"
     if "tips-table.selected_columns" in triggered_prop_ids:
         message = f"The selected columns is '{selected_column[0]}'"
     elif "tips-table.active_cell" in triggered_prop_ids:
-        message = f"The data of the selected cell is '{
-            dff.iloc[active_cell['row'], active_cell['column']]
-        }'"
-
-    figure = px.bar(dff, x="time", y="total_bill", color="day")
-    return figure, message
+        value = dff.set_index("id").at[active_cell["row_id"], active_cell["column_id"]]
+        message = f"The data of the selected cell is '{value}'"
+
+    # the figure only depends on the data, not on the selection
+    if triggered_prop_ids and "tips-version.data" not in triggered_prop_ids:
+        return no_update, message, no_update
+
+    with stage("aggregate"):
+        totals = aggregate(dff, ["time", "day"], "total_bill")
+    with stage("figure"):
+        figure = px.bar(totals, x="time", y="total_bill", color="day").to_dict()
+    with stage("patch"):
+        state = figure_state(figure)
+        if patch_figures:
+            figure = patch_figure(figure, state, previous_state)
+    return figure, message, state
+
+
+def save_edits(edits):
+    if not edits or not current_user.has_permission("user-write"):
+        raise PreventUpdate
+
+    with stage("save"):
+        result = store.save(edits)
+    frame = result.snapshot.frame
+    if result.conflict:
+        # someone saved these rows first: show what is in the database now
+        message = "These rows were changed by someone else and have been reloaded"
+        page = columnar(frame_columns(frame))
+        return result.snapshot.version, page, no_update, message
+
+    # send back the saved rows, with their new versions and coerced values
+    data = Patch()
+    positions = {edit["id"]: edit["row"] for edit in edits}
+    for row in result.rows:
+        record = frame.iloc[row]
+        data[positions[int(record["id"])]] = {
+            name: plain_value(record[name]) for name in frame.columns
+        }
+    return result.snapshot.version, no_update, data, ""
 
 
 def update_selected_style(columns):
@@ -90,16 +163,66 @@ def init_callbacks(app):
     app.callback(
         Output("total-bill-bar", "figure"),
         Output("table-triggered-message", "children"),
-        Input("tips-table", "data"),
+        Output("total-bill-figure-state", "data"),
+        Input("tips-version", "data"),
         Input("tips-table", "selected_columns"),
         Input("tips-table", "active_cell"),
-    )(update_graph_message)
+        State("total-bill-figure-state", "data"),
+    )(profiled(update_graph_message))
+
+    # diff the edited table in the browser so only changed cells are uploaded
+    app.clientside_callback(
+        """
+        function(timestamp, data, previous) {
+            if (!data || !previous || data.length !== previous.length) {
+                return window.dash_clientside.no_update;
+            }
+            const edits = [];
+            data.forEach(function(row, i) {
+                const before = previous[i];
+                Object.keys(row).forEach(function(column) {
+                    if (row[column] !== before[column]) {
+                        edits.push({
+                            row: i,
+                            id: before.id,
+                            version: before.version,
+                            column: column,
+                            value: row[column],
+                        });
+                    }
+                });
+            });
+            return edits.length ? edits : window.dash_clientside.no_update;
+        }
+        """,
+        Output("tips-edits", "data"),
+        Input("tips-table", "data_timestamp"),
+        State("tips-table", "data"),
+        State("tips-table", "data_previous"),
+    )
+
+    app.callback(
+        Output("tips-version", "data"),
+        Output("tips-page", "data"),
+        Output("tips-table", "data", allow_duplicate=True),
+        Output("tips-save-message", "children"),
+        Input("tips-edits", "data"),
+        prevent_initial_call=True,
+    )(profiled(save_edits))
+
+    # the whole table arrives as columns, the table wants rows; saved rows
+    # are patched into the table directly
+    app.clientside_callback(
+        RECORDS_FROM_COLUMNS,
+        Output("tips-table", "data"),
+        Input("tips-page", "data"),
+    )
 
     app.callback(
         Output("tips-table", "style_data_conditional"),
         Input("tips-table", "selected_columns"),
-    )(update_selected_style)
+    )(profiled(update_selected_style))
 
     app.callback(Output("tips-table", "editable"), Input("tips-table", "start_cell"))(
-        update_table_editable
+        profiled(update_table_editable)
     )
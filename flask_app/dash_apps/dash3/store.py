@@ -0,0 +1,172 @@
+import logging
+import threading
+from collections import namedtuple
+
+import pandas as pd
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as upsert
+
+from ...models import TableVersion, Tip
+from ...shared import decategorize
+
+logger = logging.getLogger(__name__)
+
+table = Tip.__table__
+DATA_COLUMNS = [c.name for c in table.columns if c.name not in ("id", "version")]
+versions = TableVersion.__table__
+
+# `version` is the table's counter row, bumped by every save no matter which
+# process made it
+Snapshot = namedtuple("Snapshot", "version frame")
+SaveResult = namedtuple("SaveResult", "snapshot rows conflict")
+
+
+class StaleEdit(Exception):
+    pass
+
+
+# a row is only written if nobody saved it since the editor loaded it
+UPDATE = (
+    update(table)
+    .where(table.c.id == bindparam("b_id"))
+    .where(table.c.version == bindparam("b_version"))
+    .values(
+        {
+            **{name: bindparam(f"v_{name}") for name in DATA_COLUMNS},
+            "version": table.c.version + 1,
+        }
+    )
+)
+
+# takes the counter row lock, so concurrent saves get distinct versions
+BUMP = (
+    upsert(versions)
+    .values(name=table.name, version=1)
+    .on_conflict_do_update(
+        index_elements=[versions.c.name], set_={"version": versions.c.version + 1}
+    )
+    .returning(versions.c.version)
+)
+CURRENT = select(func.coalesce(func.max(versions.c.version), 0)).where(
+    versions.c.name == table.name
+)
+
+
+class TableStore:
+    # Holds the tips table server-side; callbacks get it by version instead of
+    # having the browser upload the table. Snapshots are never mutated, edits
+    # produce a new frame and version. With `shared`, every snapshot is
+    # published so the other workers attach it instead of querying the table.
+
+    def __init__(self, engine, shared=None):
+        self.engine = engine
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._snapshot = self._load()
+
+    def snapshot(self, version=None):
+        # a version we have not seen means another worker saved edits
+        if version is not None and version != self._snapshot.version:
+            with self._lock:
+                if version != self._snapshot.version:
+                    self._snapshot = self._refresh(version)
+        return self._snapshot
+
+    def save(self, edits):
+        with self._lock:
+            loaded, frame = self._snapshot
+            positions = pd.Series(range(len(frame)), index=frame["id"])
+            changed = decategorize(frame).copy()
+            expected = {}
+            for edit in edits:
+                row_id, column = edit["id"], edit["column"]
+                if column not in DATA_COLUMNS or row_id not in positions.index:
+                    continue
+                position = positions[row_id]
+                expected.setdefault(position, edit["version"])
+                value = coerce(changed[column], edit["value"])
+                if value is not None:
+                    changed.iat[position, changed.columns.get_loc(column)] = value
+            if not expected:
+                return SaveResult(self._snapshot, [], False)
+
+            rows = sorted(expected)
+            params = [
+                {
+                    "b_id": int(changed.at[row, "id"]),
+                    "b_version": expected[row],
+                    **{
+                        f"v_{name}": plain_value(changed.at[row, name])
+                        for name in DATA_COLUMNS
+                    },
+                }
+                for row in rows
+            ]
+            try:
+                with self.engine.begin() as conn:
+                    # one round trip for the whole interaction, only edited rows
+                    result = conn.execute(UPDATE, params)
+                    if result.rowcount != len(params):
+                        raise StaleEdit
+                    version = conn.execute(BUMP).scalar_one()
+            except StaleEdit:
+                logger.info("Tips edit conflicted with a concurrent save")
+                self._snapshot = self._load()
+                return SaveResult(self._snapshot, rows, True)
+
+            if version != loaded + 1:
+                # other saves landed since our snapshot, their rows are not in it
+                self._snapshot = self._load()
+                return SaveResult(self._snapshot, rows, False)
+            changed.loc[changed.index[rows], "version"] += 1
+            self._snapshot = self._publish(Snapshot(version, changed))
+            return SaveResult(self._snapshot, rows, False)
+
+    def _refresh(self, version):
+        # the worker that saved the version has usually published it already
+        if self.shared is not None:
+            current = self.shared.current("tips")
+            if current is not None and current["source"] == version:
+                return self._attach(current["generation"])
+        return self._load()
+
+    def _load(self):
+        # one snapshot for the rows and the counter, so they always agree
+        with self.engine.connect().execution_options(
+            isolation_level="REPEATABLE READ"
+        ) as conn:
+            version = conn.execute(CURRENT).scalar_one()
+            frame = pd.read_sql(select(table).order_by(table.c.id), conn)
+        return self._publish(Snapshot(int(version), frame))
+
+    def _publish(self, snapshot):
+        if self.shared is None:
+            return snapshot
+        generation = self.shared.publish(
+            "tips", lambda: snapshot.frame, source=snapshot.version
+        )
+        return self._attach(generation)
+
+    def _attach(self, generation):
+        attached = self.shared.attach("tips", generation)
+        return Snapshot(attached.source, attached.frame)
+
+
+def seed_tips(conn, frame):
+    if conn.execute(select(func.count()).select_from(table)).scalar():
+        return
+    records = frame[DATA_COLUMNS].to_dict("records")
+    conn.execute(
+        insert(table), [{"id": i, **record} for i, record in enumerate(records, 1)]
+    )
+
+
+def coerce(series, value):
+    try:
+        return series.dtype.type(value) if series.dtype != object else str(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def plain_value(value):
+    return value.item() if hasattr(value, "item") else value
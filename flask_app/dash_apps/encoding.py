@@ -0,0 +1,71 @@
+import base64
+
+import numpy as np
+
+# Table pages go to the browser as one array per column instead of one dict
+# per row; numeric columns are base64 typed arrays in the {"dtype", "bdata"}
+# form Plotly uses for figure data. RECORDS_FROM_COLUMNS turns a page back
+# into the rows a DataTable expects.
+
+INT32 = np.iinfo(np.int32)
+
+
+def columnar(columns):
+    return {name: typed_array(values) for name, values in columns.items()}
+
+
+def frame_columns(frame):
+    return {name: frame[name].to_numpy() for name in frame.columns}
+
+
+def record_columns(records, names):
+    return {name: [record[name] for record in records] for name in names}
+
+
+def typed_array(values):
+    array = np.asarray(values)
+    if array.dtype.kind == "f":
+        array = array.astype("<f8")
+    elif array.dtype.kind in "iu":
+        if array.size and (array.min() < INT32.min or array.max() > INT32.max):
+            # JavaScript has no 64-bit integer typed array Plotly would accept
+            array = array.astype("<f8")
+        else:
+            array = array.astype("<i4")
+    else:
+        return array.tolist()
+    dtype = {"f": "f8", "i": "i4"}[array.dtype.kind]
+    return {"dtype": dtype, "bdata": base64.b64encode(array.tobytes()).decode()}
+
+
+RECORDS_FROM_COLUMNS = """
+function(page) {
+    if (!page) {
+        return window.dash_clientside.no_update;
+    }
+    const types = {f8: Float64Array, i4: Int32Array};
+    const names = Object.keys(page);
+    const columns = names.map(function(name) {
+        const values = page[name];
+        if (values === null || values.bdata === undefined) {
+            return values;
+        }
+        const binary = atob(values.bdata);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new types[values.dtype](bytes.buffer);
+    });
+    const length = columns.length ? columns[0].length : 0;
+    const records = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const record = {};
+        for (let j = 0; j < names.length; j++) {
+            record[names[j]] = columns[j][i];
+        }
+        records[i] = record;
+    }
+    return records;
+}
+"""
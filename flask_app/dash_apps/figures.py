@@ -0,0 +1,65 @@
+import hashlib
+
+from dash import Patch, no_update
+from plotly.io.json import to_json_plotly
+
+TRACE_DATA_KEYS = ("x", "y", "z", "text", "customdata", "hovertext", "base")
+AXIS_DATA_KEYS = ("range",)
+
+
+def figure_state(figure):
+    # A figure is described by the digest of everything a Patch would not
+    # resend (its "shape") and one digest per patchable array or axis range.
+    shape_data = []
+    values = {}
+    for i, trace in enumerate(figure.get("data", [])):
+        shape_data.append(
+            {key: value for key, value in trace.items() if key not in TRACE_DATA_KEYS}
+        )
+        for key in TRACE_DATA_KEYS:
+            if key in trace:
+                values[f"data.{i}.{key}"] = _digest(trace[key])
+
+    shape_layout = {}
+    for name, value in figure.get("layout", {}).items():
+        if _is_axis(name) and isinstance(value, dict):
+            value = {k: v for k, v in value.items() if k not in AXIS_DATA_KEYS}
+            for key in AXIS_DATA_KEYS:
+                if key in figure["layout"][name]:
+                    values[f"layout.{name}.{key}"] = _digest(
+                        figure["layout"][name][key]
+                    )
+        shape_layout[name] = value
+
+    return {"shape": _digest([shape_data, shape_layout]), "values": values}
+
+
+def patch_figure(figure, state, previous):
+    if not previous or previous.get("shape") != state["shape"]:
+        return figure
+
+    # dropped arrays cannot be expressed as assignments, resend the figure
+    if set(previous["values"]) - set(state["values"]):
+        return figure
+
+    patch = Patch()
+    changed = 0
+    for path, digest in state["values"].items():
+        if previous["values"].get(path) == digest:
+            continue
+        section, name, key = path.split(".")
+        if section == "data":
+            index = int(name)
+            patch["data"][index][key] = figure["data"][index][key]
+        else:
+            patch["layout"][name][key] = figure["layout"][name][key]
+        changed += 1
+    return patch if changed else no_update
+
+
+def _is_axis(name):
+    return name.startswith(("xaxis", "yaxis"))
+
+
+def _digest(value):
+    return hashlib.sha1(to_json_plotly(value).encode()).hexdigest()
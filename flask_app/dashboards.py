@@ -0,0 +1,65 @@
+import importlib
+import logging
+import threading
+
+from .startup import report, stage
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardRegistry:
+    # Dashboards are imported and built when the first request comes in
+    # rather than when flask_app is imported, so CLI commands and idle workers
+    # skip pandas, plotly and the data loading. All of them are mounted at
+    # once: Flask does not accept new routes after it has served a request.
+    # Forking servers can mount them in the parent instead (see preload in
+    # flask_app and gunicorn.conf.py) and start the background threads of
+    # each dashboard in the workers.
+
+    def __init__(self, app):
+        self.app = app
+        self.dashboards = {}
+        self.modules = {}
+        self.mounted = False
+        self.started = False
+        self._lock = threading.Lock()
+
+    def register(self, name, url_path, module):
+        self.dashboards[name] = (url_path, module)
+
+    def mount_all(self, start=True):
+        if not self.mounted:
+            with self._lock:
+                if not self.mounted:
+                    self._mount()
+        if start and not self.started:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self.started:
+                return
+            for name, module in self.modules.items():
+                if hasattr(module, "start"):
+                    with stage(f"start {name}"):
+                        module.start()
+            self.started = True
+
+    def wsgi(self, wsgi_app):
+        def mount_first(environ, start_response):
+            if not self.mounted or not self.started:
+                self.mount_all()
+            return wsgi_app(environ, start_response)
+
+        return mount_first
+
+    def _mount(self):
+        with self.app.app_context():
+            for name, (url_path, module_name) in self.dashboards.items():
+                with stage(f"import {name}"):
+                    module = importlib.import_module(module_name)
+                with stage(f"init {name}"):
+                    module.init_app(url_path, self.app)
+                self.modules[name] = module
+        self.mounted = True
+        logger.info("Dashboards mounted:\n%s", report())
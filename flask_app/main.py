@@ -1,10 +1,26 @@
-from flask import Blueprint, redirect, render_template, url_for
+import ipaddress
+from functools import wraps
+
+from flask import Blueprint, abort, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user
 from flask_security.decorators import auth_required
 
+from . import metrics, profiling
+
 main = Blueprint("main", __name__)
 
 
+def local_only(view):
+    # call stacks and arguments of other users' callbacks, for the host only
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ipaddress.ip_address(request.remote_addr or "0.0.0.0").is_loopback:
+            abort(404)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
 @main.route("/")
 def home():
     return redirect(url_for("main.dashboards"))
@@ -25,3 +41,26 @@ def profile():
         name=current_user.username,
         last_login=last_login_at,
     )
+
+
+@main.route("/metrics")
+@auth_required()
+def metrics_snapshot():
+    return jsonify(metrics.snapshot())
+
+
+@main.route("/metrics/callbacks")
+@auth_required()
+@local_only
+def slow_callbacks():
+    return jsonify(profiling.slow_calls())
+
+
+@main.route("/metrics/profiles/<int:profile_id>")
+@auth_required()
+@local_only
+def callback_profile(profile_id):
+    stacks = profiling.profile(profile_id)
+    if stacks is None:
+        abort(404)
+    return stacks, {"Content-Type": "text/plain; charset=utf-8"}
@@ -0,0 +1,92 @@
+import bisect
+import itertools
+import threading
+
+_lock = threading.Lock()
+_metrics = {}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def collect(self):
+        return self.value
+
+
+class Gauge:
+    def __init__(self, name, help="", function=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def collect(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    # cumulative bucket counts, Prometheus style, plus count and sum
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def collect(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "count": count,
+            "sum": total,
+            "buckets": dict(zip(bounds, itertools.accumulate(counts))),
+        }
+
+
+def counter(name, help=""):
+    return _register(name, lambda: Counter(name, help))
+
+
+def gauge(name, help="", function=None):
+    return _register(name, lambda: Gauge(name, help, function))
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return _register(name, lambda: Histogram(name, help, buckets))
+
+
+def _register(name, factory):
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = factory()
+        return _metrics[name]
+
+
+def snapshot():
+    with _lock:
+        metrics = list(_metrics.values())
+    return {metric.name: metric.collect() for metric in metrics}
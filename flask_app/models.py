@@ -1,7 +1,11 @@
+from datetime import datetime
+from typing import Optional
+
 from flask_security.models import sqla as sqla
-from sqlalchemy import select
+from sqlalchemy import BigInteger, DateTime, Double, Index, Integer, Text
+from sqlalchemy.orm import Mapped, mapped_column
 
-from .database import Base, db_session
+from .database import Base
 
 
 class Role(Base, sqla.FsRoleMixin):
@@ -12,10 +16,67 @@ class User(Base, sqla.FsUserMixin):
     __tablename__ = "user"
 
     def get_permissions(self):
-        roles = db_session.execute(
-            select(Role).join(User.roles).filter(User.id == self.id)
-        ).scalars()
+        # roles are joined in when the user is loaded, no extra query needed
         permissions = set()
-        for role in roles:
+        for role in self.roles:
             permissions.update(role.get_permissions())
         return list(permissions)
+
+
+class Gapminder(Base):
+    __tablename__ = "gapminder"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    country: Mapped[str] = mapped_column(Text)
+    population: Mapped[int] = mapped_column(BigInteger)
+    life_exp: Mapped[float] = mapped_column(Double)
+    gdp_percap: Mapped[float] = mapped_column(Double)
+
+    # (column, id) matches the keyset ordering used by the dash2 table
+    __table_args__ = tuple(
+        Index(f"ix_gapminder_{column}_id", column, "id")
+        for column in ("country", "population", "life_exp", "gdp_percap")
+    )
+
+
+class Tip(Base):
+    __tablename__ = "tips"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    total_bill: Mapped[float] = mapped_column(Double)
+    tip: Mapped[float] = mapped_column(Double)
+    sex: Mapped[str] = mapped_column(Text)
+    smoker: Mapped[str] = mapped_column(Text)
+    day: Mapped[str] = mapped_column(Text)
+    time: Mapped[str] = mapped_column(Text)
+    size: Mapped[int] = mapped_column(Integer)
+    # bumped by every update; edits name the version they were made against
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    # bumped in the same transaction as every save to the named table
+    name: Mapped[str] = mapped_column(Text, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+
+
+class Sale(Base):
+    __tablename__ = "sales"
+
+    # rows of the dash1 sales workbook, loaded by `flask import-sales`
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    date: Mapped[datetime] = mapped_column(DateTime)
+    customer: Mapped[Optional[str]] = mapped_column(Text)
+    city: Mapped[Optional[str]] = mapped_column(Text)
+    category: Mapped[Optional[str]] = mapped_column(Text)
+    product: Mapped[Optional[str]] = mapped_column(Text)
+    price: Mapped[int] = mapped_column(BigInteger)
+    quantity: Mapped[int] = mapped_column(Integer)
+    total: Mapped[int] = mapped_column(BigInteger)
+
+    __table_args__ = (
+        Index("ix_sales_date", "date"),
+        Index("ix_sales_customer_city_date", "customer", "city", "date"),
+    )
@@ -0,0 +1,205 @@
+import contextvars
+import functools
+import heapq
+import inspect
+import itertools
+import logging
+import os
+import reprlib
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+settings = {"slow_seconds": 0.5, "keep": 20}
+sampler = None
+
+_current = contextvars.ContextVar("callback_call", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_slow_calls = deque(maxlen=100)
+_profiles = []  # min-heap of (seconds, id, stacks), the slowest calls kept
+
+_inputs = reprlib.Repr()
+_inputs.maxstring = 200
+_inputs.maxother = 200
+_inputs.maxlist = _inputs.maxdict = 20
+
+
+def init_app(app):
+    settings["slow_seconds"] = app.config.get("CALLBACK_SLOW_SECONDS", 0.5)
+    settings["keep"] = app.config.get("CALLBACK_PROFILES_KEEP", 20)
+    global sampler
+    if app.config.get("CALLBACK_PROFILER", False):
+        sampler = Sampler(app.config.get("CALLBACK_PROFILER_INTERVAL", 0.005))
+    app.after_request(_record_serialization)
+
+
+def profiled(function):
+    # records latency and stage timings of a Dash callback; applied in each
+    # dashboard's init_callbacks
+    label = f"{function.__module__.split('.')[-2]}_{function.__name__}"
+    histogram = metrics.histogram(
+        f"callback_{label}_seconds", f"{function.__name__} latency"
+    )
+
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with _call(label, histogram, args):
+                return await function(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _call(label, histogram, args):
+                return function(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def stage(name):
+    # time spent in a part of the running callback; repeated stages add up
+    call = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if call is not None:
+            stages = call["stages"]
+            stages[name] = stages.get(name, 0) + time.perf_counter() - start
+
+
+def slow_calls():
+    with _lock:
+        return list(_slow_calls)
+
+
+def profile(profile_id):
+    # collapsed stacks, one "frame;frame;frame count" line each, as read by
+    # flamegraph.pl and speedscope
+    with _lock:
+        stacks = next((s for _, i, s in _profiles if i == profile_id), None)
+    if stacks is None:
+        return None
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+@contextmanager
+def _call(label, histogram, args):
+    call = {"callback": label, "stages": {}, "at": time.time()}
+    token = _current.set(call)
+    sampling = sampler is not None and sampler.watch()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        call["seconds"] = end - start
+        _current.reset(token)
+        stacks = sampler.unwatch() if sampling else None
+        histogram.observe(call["seconds"])
+        for name, seconds in call["stages"].items():
+            _stage_histogram(label, name).observe(seconds)
+        _finish(call, args, stacks)
+        if has_request_context():
+            g.callback_call = call, end
+
+
+def _finish(call, args, stacks):
+    if call["seconds"] < settings["slow_seconds"]:
+        return
+    call["inputs"] = [_inputs.repr(arg) for arg in args]
+    call["profile"] = None
+    with _lock:
+        if stacks:
+            call["profile"] = next(_ids)
+            heapq.heappush(_profiles, (call["seconds"], call["profile"], stacks))
+            if len(_profiles) > settings["keep"]:
+                heapq.heappop(_profiles)
+        _slow_calls.append(call)
+    logger.warning(
+        "Slow callback %s took %.3fs (%s) inputs=%s",
+        call["callback"],
+        call["seconds"],
+        ", ".join(f"{name} {s:.3f}s" for name, s in call["stages"].items()),
+        call["inputs"],
+    )
+
+
+def _record_serialization(response):
+    # Dash encodes the outputs after the callback returned, before the
+    # response reaches after_request
+    call, end = g.pop("callback_call", (None, None))
+    if call is not None:
+        seconds = time.perf_counter() - end
+        call["stages"]["serialize"] = seconds
+        _stage_histogram(call["callback"], "serialize").observe(seconds)
+    return response
+
+
+def _stage_histogram(label, name):
+    return metrics.histogram(
+        f"callback_{label}_{name}_seconds", f"{label} time in {name}"
+    )
+
+
+class Sampler:
+    # Samples the stacks of threads running a profiled callback. The thread
+    # is started on first use, so forked workers get their own.
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._watched:
+                # an async callback interleaved with another on the same loop
+                return False
+            self._watched[ident] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="callback-sampler", daemon=True
+                )
+                self._thread.start()
+        return True
+
+    def unwatch(self):
+        with self._lock:
+            return self._watched.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._watched.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,174 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+Attached = namedtuple("Attached", "generation frame source")
+
+
+def default_directory():
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"flask_app-{os.getuid()}")
+
+
+class SharedFrames:
+    # DataFrames published once per host as one .npy file per column and
+    # attached by every worker as read-only memory maps, so the data is held
+    # once no matter how many processes use it. Text columns are stored as
+    # category codes. Each publish creates a new generation directory and then
+    # moves the pointer file; readers keep their mapping of the generation they
+    # attached even after it is pruned.
+
+    def __init__(self, directory=None, keep=3):
+        self.directory = directory or default_directory()
+        self.keep = keep
+        os.makedirs(self.directory, exist_ok=True)
+
+    def current(self, name):
+        try:
+            with open(self._pointer(name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("format") == FORMAT_VERSION else None
+
+    def publish(self, name, load, source=None):
+        # load() is only called when the current generation was not built
+        # from the same source, so workers reacting to one change publish once
+        with self._locked(name):
+            current = self.current(name)
+            if current is not None and source is not None:
+                if current["source"] == source:
+                    return current["generation"]
+            generation = current["generation"] + 1 if current else 1
+            frame = load()
+            self._write(name, generation, frame, source)
+            self._prune(name, generation)
+            return generation
+
+    def attach(self, name, generation=None):
+        meta = self.current(name)
+        if meta is None or (generation is not None and meta["generation"] < generation):
+            raise LookupError(f"No shared frame {name!r} generation {generation}")
+        if generation is not None and meta["generation"] != generation:
+            meta = self._read_meta(name, generation)
+        path = self._generation_path(name, meta["generation"])
+
+        def load(key):
+            return np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r")
+
+        columns = {}
+        for i, (column, kind) in enumerate(meta["columns"]):
+            columns[column] = _column(load, f"c{i}", kind)
+        index = None
+        if meta["index"] is not None:
+            index_name, kind = meta["index"]
+            index = pd.Index(_column(load, "index", kind), name=index_name, copy=False)
+        frame = pd.DataFrame(columns, index=index, copy=False)
+        return Attached(meta["generation"], frame, meta["source"])
+
+    def _write(self, name, generation, frame, source):
+        path = self._generation_path(name, generation)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        def save(key, values):
+            np.save(os.path.join(tmp_path, f"{key}.npy"), values)
+
+        meta = {
+            "format": FORMAT_VERSION,
+            "generation": generation,
+            "source": source,
+            "columns": [
+                (str(column), _save_column(save, f"c{i}", frame[column]))
+                for i, column in enumerate(frame.columns)
+            ],
+            "index": None,
+        }
+        if not isinstance(frame.index, pd.RangeIndex):
+            meta["index"] = (frame.index.name, _save_column(save, "index", frame.index))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+        pointer = self._pointer(name)
+        with open(f"{pointer}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{pointer}.tmp", pointer)
+        logger.info("Published %s generation %s", name, generation)
+
+    def _read_meta(self, name, generation):
+        with open(
+            os.path.join(self._generation_path(name, generation), "meta.json")
+        ) as f:
+            return json.load(f)
+
+    def _prune(self, name, generation):
+        prefix = f"{name}."
+        for entry in os.listdir(self.directory):
+            suffix = entry[len(prefix) :]
+            if entry.startswith(prefix) and suffix.isdigit():
+                if int(suffix) <= generation - self.keep:
+                    shutil.rmtree(
+                        os.path.join(self.directory, entry), ignore_errors=True
+                    )
+
+    @contextmanager
+    def _locked(self, name):
+        with open(os.path.join(self.directory, f"{name}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _pointer(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _generation_path(self, name, generation):
+        return os.path.join(self.directory, f"{name}.{generation}")
+
+
+def decategorize(frame):
+    # text columns back as object columns, for code that edits or groups them
+    categorical = [
+        name
+        for name, dtype in frame.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    return (
+        frame.astype({name: object for name in categorical}) if categorical else frame
+    )
+
+
+def _save_column(save, key, values):
+    if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+        if not all(isinstance(v, str) for v in pd.unique(values) if not pd.isna(v)):
+            raise ValueError(f"Column {values.name!r} is not text")
+        codes, categories = pd.factorize(values)
+        # store codes in the width pandas uses, so attaching does not copy them
+        dtype = pd.Categorical.from_codes(codes[:0], categories).codes.dtype
+        save(f"{key}.codes", codes.astype(dtype))
+        save(f"{key}.categories", np.asarray(categories, dtype=str))
+        return "text"
+    save(key, np.asarray(values))
+    return "array"
+
+
+def _column(load, key, kind):
+    if kind == "text":
+        categories = load(f"{key}.categories").astype(object)
+        return pd.Categorical.from_codes(load(f"{key}.codes"), categories)
+    return load(key)
@@ -0,0 +1,24 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+timings = {}
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        logger.info("%s took %.3fs", name, timings[name])
+
+
+def report():
+    width = max([len(name) for name in timings] + [len("total")])
+    lines = [f"{name:<{width}}  {seconds:8.3f}s" for name, seconds in timings.items()]
+    lines.append(f"{'total':<{width}}  {sum(timings.values()):8.3f}s")
+    return "\n".join(lines)
@@ -0,0 +1,46 @@
+import itertools
+
+from flask_security.datastore import SQLAlchemySessionUserDatastore
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .cache import LRUCache
+
+
+class CachedUserDatastore(SQLAlchemySessionUserDatastore):
+    # Flask-Login loads the user by fs_uniquifier on every request. Those
+    # lookups are answered from a per-process cache of detached users with
+    # their roles; each request gets its own copy merged without a query.
+    # Other processes see changes once the ttl expires.
+
+    def __init__(self, session, user_model, role_model, maxsize=1024, ttl=60):
+        super().__init__(session, user_model, role_model)
+        self.users = LRUCache(maxsize=maxsize, ttl=ttl)
+        event.listen(Session, "after_flush", self._invalidate)
+
+    def find_user(self, case_insensitive=False, **kwargs):
+        if case_insensitive or list(kwargs) != ["fs_uniquifier"]:
+            return super().find_user(case_insensitive, **kwargs)
+
+        key = kwargs["fs_uniquifier"]
+        user = self.users.get(key)
+        if user is None:
+            user = super().find_user(**kwargs)
+            if user is None:
+                return None
+            # roles are joined in by find_user, detach everything loaded
+            for role in user.roles:
+                self.db.session.expunge(role)
+            self.db.session.expunge(user)
+            self.users.set(key, user)
+        return self.db.session.merge(user, load=False)
+
+    def _invalidate(self, session, flush_context):
+        for instance in itertools.chain(session.dirty, session.deleted):
+            if isinstance(instance, self.role_model):
+                self.users.clear()
+                return
+            if isinstance(instance, self.user_model):
+                history = inspect(instance).attrs.fs_uniquifier.history
+                for key in (instance.fs_uniquifier, *history.deleted):
+                    self.users.pop(key)
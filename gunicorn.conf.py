@@ -0,0 +1,18 @@
+# gunicorn --config gunicorn.conf.py flask_app:app
+#
+# Build the dashboards once in the master so that every worker shares their
+# data copy-on-write, then start each worker's own background threads.
+
+preload_app = True
+
+
+def pre_fork(server, worker):
+    import flask_app
+
+    flask_app.preload()
+
+
+def post_fork(server, worker):
+    import flask_app
+
+    flask_app.dashboards.start()